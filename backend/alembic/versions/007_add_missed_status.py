@@ -0,0 +1,23 @@
+"""Add missed status to taskstatus enum
+
+Revision ID: 007_missed_status
+Revises: 006_completed_at
+Create Date: 2026-10-18
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '007_missed_status'
+down_revision = '006_completed_at'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute("ALTER TYPE taskstatus ADD VALUE IF NOT EXISTS 'missed' AFTER 'completed'")
+
+
+def downgrade() -> None:
+    # PostgreSQL doesn't support removing enum values easily
+    # This would require recreating the type and all columns using it
+    pass
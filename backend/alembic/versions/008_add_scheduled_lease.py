@@ -0,0 +1,43 @@
+"""Add lease expiry for scheduled tasks
+
+Revision ID: 008_scheduled_lease
+Revises: 007_missed_status
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '008_scheduled_lease'
+down_revision = '007_missed_status'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    from sqlalchemy import inspect
+    bind = op.get_bind()
+    inspector = inspect(bind)
+
+    tasks_columns = [col['name'] for col in inspector.get_columns('tasks')]
+    if 'lease_expires_at' not in tasks_columns:
+        op.add_column('tasks', sa.Column('lease_expires_at', sa.DateTime(timezone=True), nullable=True))
+
+    # Give tasks that are already SCHEDULED a lease so lost timers get reclaimed
+    op.execute("""
+        UPDATE tasks
+        SET lease_expires_at = GREATEST(due_date, NOW()) + INTERVAL '2 minutes'
+        WHERE status = 'scheduled' AND lease_expires_at IS NULL
+    """)
+
+    op.create_index(
+        'ix_tasks_scheduled_lease',
+        'tasks',
+        ['lease_expires_at'],
+        postgresql_where=sa.text("status = 'scheduled'"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_tasks_scheduled_lease', table_name='tasks')
+    op.drop_column('tasks', 'lease_expires_at')
@@ -0,0 +1,34 @@
+"""Add delivery tracking fields to tasks
+
+Revision ID: 009_delivery_tracking
+Revises: 008_scheduled_lease
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '009_delivery_tracking'
+down_revision = '008_scheduled_lease'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    from sqlalchemy import inspect
+    bind = op.get_bind()
+    inspector = inspect(bind)
+
+    tasks_columns = [col['name'] for col in inspector.get_columns('tasks')]
+    if 'scheduled_at' not in tasks_columns:
+        op.add_column('tasks', sa.Column('scheduled_at', sa.DateTime(timezone=True), nullable=True))
+    if 'sent_at' not in tasks_columns:
+        op.add_column('tasks', sa.Column('sent_at', sa.DateTime(timezone=True), nullable=True))
+    if 'delivery_attempts' not in tasks_columns:
+        op.add_column('tasks', sa.Column('delivery_attempts', sa.Integer(), nullable=False, server_default='0'))
+
+
+def downgrade() -> None:
+    op.drop_column('tasks', 'delivery_attempts')
+    op.drop_column('tasks', 'sent_at')
+    op.drop_column('tasks', 'scheduled_at')
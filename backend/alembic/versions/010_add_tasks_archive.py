@@ -0,0 +1,49 @@
+"""Add tasks_archive table for finished tasks
+
+Revision ID: 010_tasks_archive
+Revises: 009_delivery_tracking
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '010_tasks_archive'
+down_revision = '009_delivery_tracking'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    from sqlalchemy import inspect
+    bind = op.get_bind()
+    inspector = inspect(bind)
+
+    if 'tasks_archive' not in inspector.get_table_names():
+        op.create_table(
+            'tasks_archive',
+            sa.Column('id', sa.Integer(), primary_key=True, autoincrement=False),
+            sa.Column('user_id', sa.Integer(), sa.ForeignKey('users.id'), nullable=True),
+            sa.Column('description', sa.String(), nullable=True),
+            sa.Column('due_date', sa.DateTime(timezone=True), nullable=True),
+            sa.Column('created_at', sa.DateTime(timezone=True), nullable=True),
+            sa.Column('completed_at', sa.DateTime(timezone=True), nullable=True),
+            sa.Column('status', postgresql.ENUM(name='taskstatus', create_type=False), nullable=True),
+            sa.Column('message_id', sa.BigInteger(), nullable=True),
+            sa.Column('chat_id', sa.BigInteger(), nullable=True),
+            sa.Column('google_calendar_event_id', sa.String(), nullable=True),
+            sa.Column('sent_at', sa.DateTime(timezone=True), nullable=True),
+            sa.Column('delivery_attempts', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('archived_at', sa.DateTime(timezone=True), nullable=False, server_default=sa.func.now()),
+        )
+        op.create_index('ix_tasks_archive_user_due', 'tasks_archive', ['user_id', 'due_date', 'id'])
+
+    # /api/tasks pages through both tables with the same keyset
+    op.create_index('ix_tasks_user_due', 'tasks', ['user_id', 'due_date', 'id'], if_not_exists=True)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_tasks_user_due', table_name='tasks')
+    op.drop_index('ix_tasks_archive_user_due', table_name='tasks_archive')
+    op.drop_table('tasks_archive')
@@ -0,0 +1,36 @@
+"""Add full-text and trigram search indexes on task descriptions
+
+Revision ID: 011_task_search
+Revises: 010_tasks_archive
+Create Date: 2026-10-18
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '011_task_search'
+down_revision = '010_tasks_archive'
+branch_labels = None
+depends_on = None
+
+SEARCH_TABLES = ('tasks', 'tasks_archive')
+
+
+def upgrade() -> None:
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+
+    for table in SEARCH_TABLES:
+        # Must match the expression in app/search.py for the planner to use it
+        op.execute(f"""
+            CREATE INDEX IF NOT EXISTS ix_{table}_description_fts ON {table}
+            USING gin (to_tsvector('russian'::regconfig, coalesce(description, '')))
+        """)
+        op.execute(f"""
+            CREATE INDEX IF NOT EXISTS ix_{table}_description_trgm ON {table}
+            USING gin (description gin_trgm_ops)
+        """)
+
+
+def downgrade() -> None:
+    for table in SEARCH_TABLES:
+        op.execute(f"DROP INDEX IF EXISTS ix_{table}_description_trgm")
+        op.execute(f"DROP INDEX IF EXISTS ix_{table}_description_fts")
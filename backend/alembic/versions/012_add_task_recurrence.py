@@ -0,0 +1,28 @@
+"""Add recurrence rule to tasks
+
+Revision ID: 012_task_recurrence
+Revises: 011_task_search
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '012_task_recurrence'
+down_revision = '011_task_search'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    from sqlalchemy import inspect
+    bind = op.get_bind()
+    inspector = inspect(bind)
+
+    tasks_columns = [col['name'] for col in inspector.get_columns('tasks')]
+    if 'recurrence' not in tasks_columns:
+        op.add_column('tasks', sa.Column('recurrence', sa.String(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('tasks', 'recurrence')
@@ -0,0 +1,26 @@
+"""Add a partial expression index for archiving finished tasks by age
+
+Revision ID: 013_finished_age
+Revises: 012_task_recurrence
+Create Date: 2026-10-18
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '013_finished_age'
+down_revision = '012_task_recurrence'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Must match the predicate in app/tasks.py _archive_batch for the planner to use it
+    op.execute("""
+        CREATE INDEX IF NOT EXISTS ix_tasks_finished_age ON tasks
+        ((coalesce(completed_at, sent_at, due_date)))
+        WHERE status IN ('sent', 'completed', 'missed')
+    """)
+
+
+def downgrade() -> None:
+    op.execute("DROP INDEX IF EXISTS ix_tasks_finished_age")
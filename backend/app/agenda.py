@@ -0,0 +1,73 @@
+"""
+Agenda: a user's open tasks bucketed into overdue / today / tomorrow / later.
+
+Bucketing, per-bucket counts and the per-bucket item limit are all computed in
+one SQL query, with "today" and "tomorrow" taken in the user's IANA
+timezone, so the payload size does not depend on how many tasks the user has.
+"""
+
+from typing import Optional
+
+from sqlalchemy import case, cast, Date, func, literal, select
+from sqlalchemy.orm import Session
+
+from . import models
+from .models import TaskStatus
+from .responses import task_rows_to_dicts
+from .utils import get_zone
+
+AGENDA_BUCKETS = ("overdue", "today", "tomorrow", "later")
+OPEN_STATUSES = (TaskStatus.CREATED, TaskStatus.SCHEDULED, TaskStatus.SENT, TaskStatus.MISSED)
+
+
+def empty_agenda() -> dict:
+    return {name: {"count": 0, "tasks": []} for name in AGENDA_BUCKETS}
+
+
+def get_agenda(db: Session, user_id: int, timezone_str: Optional[str], per_bucket: int) -> dict:
+    """{bucket: {"count": total, "tasks": first `per_bucket` tasks}} for every bucket."""
+    # Only names Postgres will also accept reach the query
+    zone_name = timezone_str if timezone_str and get_zone(timezone_str) else "UTC"
+    zone = literal(zone_name)
+
+    now = func.now()
+    local_due = cast(func.timezone(zone, models.Task.due_date), Date)
+    local_today = cast(func.timezone(zone, now), Date)
+    is_overdue = models.Task.due_date < now
+    bucket = case(
+        (is_overdue, "overdue"),
+        (local_due == local_today, "today"),
+        (local_due == local_today + 1, "tomorrow"),
+        else_="later",
+    ).label("bucket")
+
+    ranked = (
+        select(
+            models.Task.id,
+            models.Task.description,
+            models.Task.due_date,
+            models.Task.status,
+            models.Task.created_at,
+            models.Task.completed_at,
+            bucket,
+            func.count().over(partition_by=bucket).label("bucket_count"),
+            func.row_number().over(
+                partition_by=bucket,
+                # Most recent overdue first, everything else soonest first
+                order_by=(case((is_overdue, models.Task.due_date)).desc(), models.Task.due_date, models.Task.id),
+            ).label("position"),
+        )
+        .where(models.Task.user_id == user_id, models.Task.status.in_(OPEN_STATUSES))
+        .subquery()
+    )
+    rows = db.execute(
+        select(ranked).where(ranked.c.position <= per_bucket).order_by(ranked.c.bucket, ranked.c.position)
+    ).all()
+
+    agenda = empty_agenda()
+    tasks = task_rows_to_dicts([row[:6] for row in rows], timezone_str)
+    for row, task in zip(rows, tasks):
+        entry = agenda[row.bucket]
+        entry["count"] = row.bucket_count
+        entry["tasks"].append(task)
+    return agenda
@@ -12,6 +12,8 @@ import time
 import os
 import json
 import logging
+import threading
+from collections import OrderedDict
 from urllib.parse import parse_qs, unquote
 from typing import Optional
 from pydantic import BaseModel
@@ -20,6 +22,7 @@ from fastapi import HTTPException, Header, Query
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 INTERNAL_API_KEY = os.getenv("INTERNAL_API_KEY")
 INIT_DATA_TTL = 86400  # 24 hours in seconds
+INIT_DATA_CACHE_SIZE = int(os.getenv("INIT_DATA_CACHE_SIZE", "10000"))
 
 # Validate required environment variables at startup
 if not BOT_TOKEN:
@@ -27,6 +30,20 @@ if not BOT_TOKEN:
 if not INTERNAL_API_KEY:
     raise RuntimeError("INTERNAL_API_KEY environment variable is required")
 
+# secret_key = HMAC-SHA256("WebAppData", BOT_TOKEN) depends only on the token
+_WEBAPP_SECRET_KEY = hmac.new(
+    b"WebAppData",
+    BOT_TOKEN.encode(),
+    hashlib.sha256
+).digest()
+
+# Already-validated initData -> (TelegramUser, expires_at). The Mini App sends
+# the same initData on every request, so after the first one auth is a dict
+# lookup. Keyed by the full string, which includes the signed hash, so a
+# forged payload can never hit an entry; expiry is capped at auth_date + TTL.
+_init_data_cache: "OrderedDict[str, tuple[TelegramUser, float]]" = OrderedDict()
+_init_data_cache_lock = threading.Lock()
+
 
 class TelegramUser(BaseModel):
     """Parsed Telegram user from initData."""
@@ -39,6 +56,29 @@ class TelegramUser(BaseModel):
     auth_date: int
 
 
+def _get_cached_init_data(init_data: str) -> Optional[TelegramUser]:
+    """Return the cached TelegramUser for this initData if it has not expired."""
+    with _init_data_cache_lock:
+        entry = _init_data_cache.get(init_data)
+        if entry is None:
+            return None
+        user, expires_at = entry
+        if time.time() > expires_at:
+            del _init_data_cache[init_data]
+            return None
+        _init_data_cache.move_to_end(init_data)
+        return user
+
+
+def _cache_init_data(init_data: str, user: TelegramUser, expires_at: float) -> None:
+    """Remember a validated initData, evicting the least recently used entry."""
+    with _init_data_cache_lock:
+        _init_data_cache[init_data] = (user, expires_at)
+        _init_data_cache.move_to_end(init_data)
+        while len(_init_data_cache) > INIT_DATA_CACHE_SIZE:
+            _init_data_cache.popitem(last=False)
+
+
 def validate_init_data(init_data: str) -> Optional[TelegramUser]:
     """
     Validate Telegram Mini App initData using HMAC-SHA256.
@@ -51,7 +91,13 @@ def validate_init_data(init_data: str) -> Optional[TelegramUser]:
     5. Compute: computed_hash = HMAC-SHA256(secret_key, data_check_string).hex()
     6. Compare computed_hash with received hash
     7. Check auth_date is not too old
+
+    Successful results are cached until auth_date + INIT_DATA_TTL.
     """
+    cached = _get_cached_init_data(init_data)
+    if cached:
+        return cached
+
     try:
         # Parse URL-encoded data
         parsed = parse_qs(init_data, keep_blank_values=True)
@@ -69,16 +115,9 @@ def validate_init_data(init_data: str) -> Optional[TelegramUser]:
             data_check_pairs.append(f"{key}={value}")
         data_check_string = "\n".join(data_check_pairs)
 
-        # Compute secret_key = HMAC-SHA256("WebAppData", BOT_TOKEN)
-        secret_key = hmac.new(
-            b"WebAppData",
-            BOT_TOKEN.encode(),
-            hashlib.sha256
-        ).digest()
-
-        # Compute hash
+        # Compute hash (secret_key is derived once at import)
         computed_hash = hmac.new(
-            secret_key,
+            _WEBAPP_SECRET_KEY,
             data_check_string.encode(),
             hashlib.sha256
         ).hexdigest()
@@ -107,7 +146,7 @@ def validate_init_data(init_data: str) -> Optional[TelegramUser]:
 
         user_data = json.loads(unquote(user_json))
 
-        return TelegramUser(
+        user = TelegramUser(
             id=user_data['id'],
             first_name=user_data.get('first_name'),
             last_name=user_data.get('last_name'),
@@ -116,6 +155,8 @@ def validate_init_data(init_data: str) -> Optional[TelegramUser]:
             is_premium=user_data.get('is_premium'),
             auth_date=auth_date
         )
+        _cache_init_data(init_data, user, auth_date + INIT_DATA_TTL)
+        return user
 
     except Exception as e:
         logging.error(f"Error validating initData: {e}")
@@ -0,0 +1,86 @@
+"""
+Leader-elected Celery beat scheduler.
+
+Several celery-beat replicas can run at once: they compete for a Redis key
+and only the holder sends periodic tasks. The leader renews the key on every
+tick; if it dies, the key expires and another replica takes over within
+LEADER_TTL_SECONDS.
+
+Usage: celery -A app.celery_app beat -S app.beat:LeaderElectedScheduler
+"""
+
+import logging
+import os
+import socket
+import uuid
+
+import redis
+from celery.beat import PersistentScheduler
+
+from .celery_app import REDIS_HOST
+
+LEADER_KEY = "celery-beat:leader"
+LEADER_TTL_SECONDS = int(os.getenv("BEAT_LEADER_TTL_SECONDS", "15"))
+FOLLOWER_POLL_SECONDS = float(os.getenv("BEAT_FOLLOWER_POLL_SECONDS", "2"))
+
+# Extend the lease only if we still own it
+_RENEW_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+# Delete the key only if we still own it
+_RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+class LeaderElectedScheduler(PersistentScheduler):
+    """PersistentScheduler that only dispatches while holding the leader key."""
+
+    def __init__(self, *args, **kwargs):
+        self._redis = redis.Redis(host=REDIS_HOST, port=6379, decode_responses=True)
+        self._node_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._renew = self._redis.register_script(_RENEW_SCRIPT)
+        self._release = self._redis.register_script(_RELEASE_SCRIPT)
+        self._is_leader = False
+        super().__init__(*args, **kwargs)
+
+    def _acquire_or_renew(self) -> bool:
+        ttl_ms = LEADER_TTL_SECONDS * 1000
+        try:
+            if self._redis.set(LEADER_KEY, self._node_id, nx=True, px=ttl_ms):
+                leader = True
+            else:
+                leader = bool(self._renew(keys=[LEADER_KEY], args=[self._node_id, ttl_ms]))
+        except redis.RedisError as e:
+            logging.error(f"Beat leader election failed: {e}")
+            leader = False
+
+        if leader != self._is_leader:
+            if leader:
+                logging.info(f"Beat {self._node_id} became leader")
+            else:
+                logging.warning(f"Beat {self._node_id} lost leadership")
+            self._is_leader = leader
+        return leader
+
+    def tick(self, *args, **kwargs):
+        if not self._acquire_or_renew():
+            return FOLLOWER_POLL_SECONDS
+        # Never sleep past the point where the lease would lapse
+        return min(super().tick(*args, **kwargs), LEADER_TTL_SECONDS / 3)
+
+    def close(self):
+        if self._is_leader:
+            try:
+                self._release(keys=[LEADER_KEY], args=[self._node_id])
+                logging.info(f"Beat {self._node_id} released leadership")
+            except redis.RedisError as e:
+                logging.error(f"Error releasing beat leadership: {e}")
+        super().close()
@@ -1,8 +1,18 @@
 from celery import Celery
+from kombu import Queue
 import os
 
 REDIS_HOST = os.getenv("REDIS_HOST", "redis")
 
+# Queue names. Reminders and the scheduler sweep are latency-critical and must
+# never wait behind slow LLM calls, so each gets its own queue and worker pool.
+# Bulk maintenance (archiving, stats reconciliation) runs on the LLM pool so its
+# long transactions never occupy a notifications worker slot.
+NOTIFICATIONS_QUEUE = "notifications"
+SCHEDULER_QUEUE = "scheduler"
+LLM_QUEUE = "llm"
+MAINTENANCE_QUEUE = "maintenance"
+
 app = Celery(
     "tasks",
     broker=f"redis://{REDIS_HOST}:6379/0",
@@ -12,11 +22,56 @@ app = Celery(
 
 app.conf.timezone = 'UTC'
 
+app.conf.task_queues = (
+    Queue(NOTIFICATIONS_QUEUE),
+    Queue(SCHEDULER_QUEUE),
+    Queue(LLM_QUEUE),
+    Queue(MAINTENANCE_QUEUE),
+)
+app.conf.task_default_queue = LLM_QUEUE
+
+app.conf.task_routes = {
+    'app.tasks.send_task_notification': {'queue': NOTIFICATIONS_QUEUE, 'priority': 0},
+    # Catch-up digests must not delay on-time reminders
+    'app.tasks.send_digest_notification': {'queue': NOTIFICATIONS_QUEUE, 'priority': 3},
+    'app.tasks.send_grouped_notification': {'queue': NOTIFICATIONS_QUEUE, 'priority': 0},
+    'app.tasks.check_due_tasks': {'queue': SCHEDULER_QUEUE, 'priority': 0},
+    'app.tasks.archive_finished_tasks': {'queue': MAINTENANCE_QUEUE, 'priority': 9},
+    'app.tasks.reconcile_user_stats': {'queue': MAINTENANCE_QUEUE, 'priority': 9},
+    'app.tasks.process_llm_request': {'queue': LLM_QUEUE, 'priority': 5},
+}
+
+# Redis emulates priorities by splitting each queue into sub-queues;
+# 0 is the highest priority.
+app.conf.broker_transport_options = {
+    'priority_steps': list(range(10)),
+    'sep': ':',
+    'queue_order_strategy': 'priority',
+}
+
+# Workers reserve only one message per process so a long LLM call never holds
+# reminders hostage in its prefetch buffer. Concurrency is set per pool on the
+# worker command line (see docker-compose.yml).
+app.conf.worker_prefetch_multiplier = int(os.getenv("CELERY_PREFETCH_MULTIPLIER", "1"))
+app.conf.task_acks_late = True
+app.conf.task_reject_on_worker_lost = True
+
+# Wake beat often enough for LeaderElectedScheduler to renew its lease
+app.conf.beat_max_loop_interval = 5
+
 app.conf.beat_schedule = {
     'check-due-tasks-every-minute': {
         'task': 'app.tasks.check_due_tasks',
         'schedule': 60.0,
     },
+    'archive-finished-tasks-hourly': {
+        'task': 'app.tasks.archive_finished_tasks',
+        'schedule': 3600.0,
+    },
+    'reconcile-user-stats-daily': {
+        'task': 'app.tasks.reconcile_user_stats',
+        'schedule': 86400.0,
+    },
 }
 
 if __name__ == "__main__":
@@ -1,12 +1,27 @@
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 import os
+from .metrics import instrument_engine
+from .query_counter import instrument_engine_queries
 
 DATABASE_URL = os.getenv("DATABASE_URL")
+# Optional streaming replica for read-only endpoints
+DATABASE_REPLICA_URL = os.getenv("DATABASE_REPLICA_URL")
 
 engine = create_engine(DATABASE_URL)
+instrument_engine(engine)
+instrument_engine_queries(engine)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+if DATABASE_REPLICA_URL:
+    replica_engine = create_engine(DATABASE_REPLICA_URL)
+    instrument_engine(replica_engine)
+    instrument_engine_queries(replica_engine)
+    ReplicaSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=replica_engine)
+else:
+    replica_engine = None
+    ReplicaSessionLocal = None
+
 def get_db():
     db = SessionLocal()
     try:
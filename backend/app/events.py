@@ -0,0 +1,59 @@
+"""
+Per-user task change events for the Mini App.
+
+Writers (API endpoints and Celery tasks) publish to a Redis pub/sub channel
+per telegram_id; the backend's SSE endpoint relays that channel to the
+user's open Mini App. Publishing is fire-and-forget: a Redis failure is
+logged and never fails the write that triggered it.
+"""
+
+import logging
+import os
+from typing import AsyncIterator, Optional
+
+import orjson
+import redis
+import redis.asyncio as aioredis
+
+from . import models
+from .metrics import InstrumentedRedis
+from .responses import task_rows_to_dicts
+
+REDIS_HOST = os.getenv("REDIS_HOST", "redis")
+SSE_KEEPALIVE_SECONDS = 15  # below nginx's default 60s proxy_read_timeout
+
+redis_client = InstrumentedRedis(host=REDIS_HOST, port=6379)
+async_redis_client = aioredis.Redis(host=REDIS_HOST, port=6379)
+
+
+def _channel(telegram_id: int) -> str:
+    return f"task_events:{telegram_id}"
+
+
+def publish_task_event(telegram_id: int, event: str, task: models.Task, timezone_str: Optional[str]) -> None:
+    """Publish a task change ("created", "updated" or "sent") with the task in TaskResponse shape."""
+    row = (task.id, task.description, task.due_date, task.status, task.created_at, task.completed_at)
+    payload = {"event": event, "task": task_rows_to_dicts([row], timezone_str)[0]}
+    try:
+        redis_client.publish(_channel(telegram_id), orjson.dumps(payload))
+    except redis.RedisError as e:
+        logging.error(f"Error publishing task event for {telegram_id}: {e}")
+
+
+async def stream_task_events(telegram_id: int, is_disconnected) -> AsyncIterator[bytes]:
+    """Yield SSE frames for a user's task events until the client goes away."""
+    pubsub = async_redis_client.pubsub()
+    await pubsub.subscribe(_channel(telegram_id))
+    try:
+        yield b"retry: 3000\n\n"
+        while not await is_disconnected():
+            message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=SSE_KEEPALIVE_SECONDS)
+            if message is None:
+                yield b": keepalive\n\n"
+                continue
+            yield b"event: task\ndata: " + message["data"] + b"\n\n"
+    except Exception as e:
+        logging.error(f"Task event stream for {telegram_id} failed: {e}")
+    finally:
+        await pubsub.unsubscribe()
+        await pubsub.aclose()
@@ -0,0 +1,80 @@
+"""
+Idempotency-Key support for internal write endpoints.
+
+The first request with a given key claims it in Redis (SET NX) before doing
+any work and stores its response when done. Retries with the same key get
+the stored response back instead of inserting or enqueueing again. Keys
+expire after IDEMPOTENCY_TTL seconds. A failed request releases its key so
+it can be retried.
+"""
+
+import json
+import logging
+import os
+from typing import Optional
+
+import redis
+from fastapi import HTTPException
+
+from .metrics import InstrumentedRedis
+
+REDIS_HOST = os.getenv("REDIS_HOST", "redis")
+IDEMPOTENCY_TTL = int(os.getenv("IDEMPOTENCY_TTL", "86400"))
+_PENDING = "__pending__"
+
+redis_client = InstrumentedRedis(host=REDIS_HOST, port=6379, decode_responses=True)
+
+
+def _key(scope: str, idempotency_key: str) -> str:
+    return f"idempotency:{scope}:{idempotency_key}"
+
+
+def begin(scope: str, idempotency_key: Optional[str], pending_ttl: Optional[int] = None) -> Optional[dict]:
+    """
+    Claim the key. Returns None if the caller should do the work, or the
+    stored response of the original request. Raises 409 while the original
+    request is still running.
+
+    `pending_ttl` bounds how long the claim survives a caller that dies
+    before complete() or release(); it defaults to IDEMPOTENCY_TTL.
+    """
+    if not idempotency_key:
+        return None
+
+    key = _key(scope, idempotency_key)
+    try:
+        if redis_client.set(key, _PENDING, nx=True, ex=pending_ttl or IDEMPOTENCY_TTL):
+            return None
+        stored = redis_client.get(key)
+    except redis.RedisError as e:
+        # Without Redis, fall back to at-least-once behaviour
+        logging.error(f"Idempotency check failed for {key}: {e}")
+        return None
+
+    if stored is None:
+        # Expired between SET and GET; treat as a fresh request
+        return begin(scope, idempotency_key, pending_ttl)
+    if stored == _PENDING:
+        raise HTTPException(status_code=409, detail="Запрос с этим Idempotency-Key уже обрабатывается")
+    logging.info(f"Replaying response for idempotency key {key}")
+    return json.loads(stored)
+
+
+def complete(scope: str, idempotency_key: Optional[str], response: dict) -> None:
+    """Store the response for replay to retries."""
+    if not idempotency_key:
+        return
+    try:
+        redis_client.set(_key(scope, idempotency_key), json.dumps(response), ex=IDEMPOTENCY_TTL)
+    except redis.RedisError as e:
+        logging.error(f"Error storing idempotent response for {idempotency_key}: {e}")
+
+
+def release(scope: str, idempotency_key: Optional[str]) -> None:
+    """Forget a key whose request failed, so a retry runs again."""
+    if not idempotency_key:
+        return
+    try:
+        redis_client.delete(_key(scope, idempotency_key))
+    except redis.RedisError as e:
+        logging.error(f"Error releasing idempotency key {idempotency_key}: {e}")
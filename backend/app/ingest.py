@@ -0,0 +1,188 @@
+"""
+Direct ingestion of bot messages from a Redis stream.
+
+The bot XADDs each text/voice request to LLM_REQUESTS_STREAM instead of
+calling POST /api/process-async. This consumer reads the stream through a
+consumer group and hands each entry to process_llm_request on the llm Celery
+queue, so ingestion does not depend on the HTTP API being up.
+
+Reliability:
+- An entry is acknowledged (and deleted) only after it was enqueued; entries
+  of a crashed consumer are reclaimed with XAUTOCLAIM after INGEST_CLAIM_IDLE_MS.
+- Entries delivered INGEST_MAX_DELIVERIES times without success are moved
+  to LLM_REQUESTS_DEAD_LETTER_STREAM.
+- Redelivered entries are deduplicated by their idempotency key, shared with
+  the HTTP endpoint. An entry whose key is still pending stays pending in the
+  group; the claim expires after INGEST_PENDING_TTL_SECONDS, before the entry
+  can be reclaimed, so a consumer dying mid-entry does not lose it.
+- While the llm queue is over its busy threshold nothing is read, so the
+  backlog waits in the stream rather than in the broker.
+
+Run with `python -m app.ingest`; several instances can share the group.
+"""
+
+import logging
+import os
+import socket
+import sys
+import time
+
+import redis
+from fastapi import HTTPException
+
+from . import idempotency, rate_limit
+from .metrics import InstrumentedRedis
+
+REDIS_HOST = os.getenv("REDIS_HOST", "redis")
+LLM_REQUESTS_STREAM = "llm_requests"
+LLM_REQUESTS_DEAD_LETTER_STREAM = "llm_requests:dead"
+INGEST_GROUP = "llm-ingest"
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "50"))
+INGEST_BLOCK_MS = int(os.getenv("INGEST_BLOCK_MS", "5000"))
+INGEST_CLAIM_IDLE_MS = int(os.getenv("INGEST_CLAIM_IDLE_MS", "60000"))
+INGEST_MAX_DELIVERIES = int(os.getenv("INGEST_MAX_DELIVERIES", "5"))
+INGEST_BUSY_SLEEP_SECONDS = 1.0
+# Handling an entry takes milliseconds; half the claim idle time leaves ample margin
+INGEST_PENDING_TTL_SECONDS = max(1, INGEST_CLAIM_IDLE_MS // 2000)
+
+redis_client = InstrumentedRedis(host=REDIS_HOST, port=6379, decode_responses=True)
+
+
+def ensure_group() -> None:
+    try:
+        redis_client.xgroup_create(LLM_REQUESTS_STREAM, INGEST_GROUP, id="0", mkstream=True)
+    except redis.ResponseError as e:
+        if "BUSYGROUP" not in str(e):
+            raise
+
+
+def _ack(entry_id: str) -> None:
+    with redis_client.pipeline() as pipe:
+        pipe.xack(LLM_REQUESTS_STREAM, INGEST_GROUP, entry_id)
+        # Deleting handled entries keeps XLEN equal to the backlog the bot checks
+        pipe.xdel(LLM_REQUESTS_STREAM, entry_id)
+        pipe.execute()
+
+
+def _dead_letter(entry_id: str, fields: dict, reason: str) -> None:
+    logging.error(f"Dead-lettering stream entry {entry_id}: {reason}")
+    redis_client.xadd(
+        LLM_REQUESTS_DEAD_LETTER_STREAM,
+        {**fields, "source_id": entry_id, "reason": reason},
+        maxlen=10000,
+        approximate=True,
+    )
+    _ack(entry_id)
+
+
+def handle_entry(entry_id: str, fields: dict) -> None:
+    """Enqueue one request. Raises to leave the entry pending for a retry."""
+    from .tasks import edit_message, process_llm_request
+
+    idempotency_key = fields.get("idempotency_key")
+    # Raises 409 while the key is pending: the entry is left unacknowledged
+    replay = idempotency.begin("process-async", idempotency_key, pending_ttl=INGEST_PENDING_TTL_SECONDS)
+    if replay is not None:
+        logging.info(f"Stream entry {entry_id} already handled, acknowledging")
+        _ack(entry_id)
+        return
+
+    try:
+        telegram_id = int(fields["telegram_id"])
+        chat_id = int(fields["chat_id"])
+        message_id = int(fields["message_id"])
+
+        allowed, _ = rate_limit.acquire(rate_limit.llm_bucket(telegram_id))
+        if not allowed:
+            edit_message(chat_id, message_id, "⏳ Слишком много запросов. Подождите немного и попробуйте снова.")
+        else:
+            process_llm_request.delay(
+                telegram_id=telegram_id,
+                chat_id=chat_id,
+                message_id=message_id,
+                text=fields["text"],
+                timezone_str=fields["timezone"],
+            )
+    except Exception:
+        idempotency.release("process-async", idempotency_key)
+        raise
+
+    idempotency.complete("process-async", idempotency_key, {"message": "Запрос принят в обработку"})
+    _ack(entry_id)
+
+
+def _process(entries) -> None:
+    for entry_id, fields in entries:
+        if fields is None:
+            # Trimmed from the stream while pending; nothing left to process
+            _ack(entry_id)
+            continue
+        try:
+            handle_entry(entry_id, fields)
+        except HTTPException:
+            logging.info(f"Stream entry {entry_id} is being handled elsewhere, leaving it pending")
+        except (KeyError, ValueError) as e:
+            _dead_letter(entry_id, fields, f"malformed entry: {e}")
+        except Exception as e:
+            logging.error(f"Error handling stream entry {entry_id}, will retry: {e}")
+
+
+def _reclaim(consumer: str) -> None:
+    """Take over entries left pending by dead consumers; dead-letter the ones that keep failing."""
+    _, entries, _ = redis_client.xautoclaim(
+        LLM_REQUESTS_STREAM, INGEST_GROUP, consumer, INGEST_CLAIM_IDLE_MS, start_id="0-0", count=INGEST_BATCH_SIZE
+    )
+    if not entries:
+        return
+
+    pending = redis_client.xpending_range(
+        LLM_REQUESTS_STREAM, INGEST_GROUP, min=entries[0][0], max=entries[-1][0], count=len(entries)
+    )
+    deliveries = {item["message_id"]: item["times_delivered"] for item in pending}
+    retry = []
+    for entry_id, fields in entries:
+        if deliveries.get(entry_id, 0) > INGEST_MAX_DELIVERIES:
+            _dead_letter(entry_id, fields or {}, f"failed after {INGEST_MAX_DELIVERIES} deliveries")
+        else:
+            retry.append((entry_id, fields))
+    logging.warning(f"Reclaimed {len(entries)} pending stream entries")
+    _process(retry)
+
+
+def run() -> None:
+    consumer = f"{socket.gethostname()}-{os.getpid()}"
+    ensure_group()
+    logging.info(f"Ingest consumer {consumer} reading {LLM_REQUESTS_STREAM}")
+
+    last_reclaim = 0.0
+    while True:
+        try:
+            if rate_limit.llm_queue_busy():
+                time.sleep(INGEST_BUSY_SLEEP_SECONDS)
+                continue
+
+            if time.monotonic() - last_reclaim > INGEST_CLAIM_IDLE_MS / 1000:
+                _reclaim(consumer)
+                last_reclaim = time.monotonic()
+
+            response = redis_client.xreadgroup(
+                INGEST_GROUP, consumer, {LLM_REQUESTS_STREAM: ">"},
+                count=INGEST_BATCH_SIZE, block=INGEST_BLOCK_MS,
+            )
+            for _, entries in response or []:
+                _process(entries)
+        except redis.ResponseError as e:
+            if "NOGROUP" in str(e):
+                # Stream or group was deleted; recreate and carry on
+                ensure_group()
+                continue
+            logging.error(f"Ingest consumer Redis error: {e}")
+            time.sleep(INGEST_BUSY_SLEEP_SECONDS)
+        except redis.RedisError as e:
+            logging.error(f"Ingest consumer Redis error: {e}")
+            time.sleep(INGEST_BUSY_SLEEP_SECONDS)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, stream=sys.stdout)
+    run()
@@ -1,22 +1,44 @@
-from fastapi import FastAPI, Depends, HTTPException, Query
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, Header
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import RedirectResponse
+from fastapi.responses import JSONResponse, RedirectResponse, StreamingResponse, Response
 from pydantic import BaseModel
 from datetime import datetime, timezone
 from zoneinfo import ZoneInfo
 from typing import Optional, List
 import logging
 import json
+import math
 import os
-import redis
+import time
 from dotenv import load_dotenv
-from sqlalchemy.orm import Session
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from sqlalchemy import select, tuple_, union_all
+from sqlalchemy.orm import Session, joinedload
 from . import models, db
 from .db import SessionLocal
 from .models import TaskStatus
 from .utils import format_user_time
 from . import google_calendar
-from .auth import TelegramUser, get_telegram_user, verify_internal_api_key, get_user_id_flexible, get_auth_flexible, AuthResult
+from .user_cache import get_cached_user, invalidate_user
+from .users import ensure_user, upsert_user
+from .responses import json_response, task_rows_to_dicts
+from .events import publish_task_event, stream_task_events
+from . import idempotency
+from .query_counter import track_queries, QUERY_COUNT_HEADER, QUERY_TIME_HEADER
+from .replica import mark_user_write, read_session_factory
+from .recurrence import materialize_next, normalize_rule
+from . import rate_limit
+from . import agenda
+from . import search
+from . import stats
+from .metrics import (
+    DB_SESSION_DURATION,
+    HTTP_IN_FLIGHT,
+    HTTP_REQUEST_DURATION,
+    HTTP_REQUESTS,
+    InstrumentedRedis,
+)
+from .auth import TelegramUser, get_telegram_user, verify_internal_api_key, get_user_id_flexible, get_auth_flexible, AuthResult, validate_init_data
 
 load_dotenv()
 
@@ -25,9 +47,109 @@ logging.basicConfig(level=logging.INFO)
 
 app = FastAPI()
 
+QUERY_DEBUG_HEADERS = os.getenv("QUERY_DEBUG_HEADERS", "") == "1"
+QUERY_COUNT_WARN_THRESHOLD = int(os.getenv("QUERY_COUNT_WARN_THRESHOLD", "20"))
+RATE_LIMIT_EXEMPT_PATHS = {"/metrics", "/api/google/callback"}
+LLM_BUSY_RETRY_AFTER_SECONDS = int(os.getenv("LLM_BUSY_RETRY_AFTER_SECONDS", "30"))
+TASKS_PAGE_SIZE = int(os.getenv("TASKS_PAGE_SIZE", "200"))
+TASKS_PAGE_SIZE_MAX = 500
+SEARCH_PAGE_SIZE = 20
+SEARCH_PAGE_SIZE_MAX = 100
+AGENDA_PER_BUCKET = 5
+AGENDA_PER_BUCKET_MAX = 50
+
 # Redis client for one-time tokens
 REDIS_HOST = os.getenv("REDIS_HOST", "redis")
-redis_client = redis.Redis(host=REDIS_HOST, port=6379, decode_responses=True)
+redis_client = InstrumentedRedis(host=REDIS_HOST, port=6379, decode_responses=True)
+
+
+def _rate_limit_identity(request: Request) -> Optional[str]:
+    """
+    Per-user bucket key for a request.
+
+    Mini App calls are keyed by the initData user, internal calls by their
+    telegram_id query param. Internal calls without one (the bot's
+    /schedule and /api/process-async) only hit the global bucket here:
+    keying them by IP would put every bot user in one bucket.
+
+    Anything else is keyed by the client IP that nginx forwards: X-Real-IP,
+    else the last X-Forwarded-For hop (the one nginx appended itself), and
+    the socket peer only when the request did not come through the proxy.
+    """
+    authorization = request.headers.get("authorization", "")
+    if authorization.lower().startswith("tma "):
+        user = validate_init_data(authorization[4:])
+        if user:
+            return f"tg:{user.id}"
+    elif authorization.lower().startswith("bearer "):
+        telegram_id = request.query_params.get("telegram_id")
+        return f"tg:{telegram_id}" if telegram_id else None
+    client_ip = request.headers.get("x-real-ip", "").strip()
+    if not client_ip:
+        forwarded_for = request.headers.get("x-forwarded-for", "")
+        client_ip = forwarded_for.rsplit(",", 1)[-1].strip()
+    if not client_ip and request.client:
+        client_ip = request.client.host
+    return f"ip:{client_ip}" if client_ip else None
+
+
+@app.middleware("http")
+async def enforce_rate_limit(request: Request, call_next):
+    """Per-user and global token buckets in Redis; 429 with Retry-After when exhausted."""
+    if request.url.path in RATE_LIMIT_EXEMPT_PATHS:
+        return await call_next(request)
+
+    identity = _rate_limit_identity(request)
+    buckets = [rate_limit.global_bucket()]
+    if identity:
+        buckets.append(rate_limit.user_bucket(identity))
+
+    allowed, retry_after = rate_limit.acquire(*buckets)
+    if not allowed:
+        return JSONResponse(
+            status_code=429,
+            content={"detail": "Слишком много запросов. Попробуйте позже."},
+            headers={"Retry-After": str(math.ceil(retry_after))},
+        )
+    return await call_next(request)
+
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """Per-route latency, status code and in-flight metrics."""
+    HTTP_IN_FLIGHT.inc()
+    started = time.perf_counter()
+    status = "500"
+    try:
+        response = await call_next(request)
+        status = str(response.status_code)
+        return response
+    finally:
+        HTTP_IN_FLIGHT.dec()
+        # Label by route template (/api/tasks/{task_id}), not the raw path
+        route = request.scope.get("route")
+        route_path = route.path if route else "unmatched"
+        HTTP_REQUEST_DURATION.labels(request.method, route_path).observe(time.perf_counter() - started)
+        HTTP_REQUESTS.labels(request.method, route_path, status).inc()
+
+
+@app.middleware("http")
+async def count_request_queries(request: Request, call_next):
+    """Count SQL statements per request; warn on suspicious counts (likely N+1)."""
+    with track_queries() as stats:
+        response = await call_next(request)
+
+    db_ms = stats.duration * 1000
+    if stats.count > QUERY_COUNT_WARN_THRESHOLD:
+        logging.warning(f"{request.method} {request.url.path}: {stats.count} SQL queries in {db_ms:.1f}ms")
+    elif stats.count:
+        logging.debug(f"{request.method} {request.url.path}: {stats.count} SQL queries in {db_ms:.1f}ms")
+
+    if QUERY_DEBUG_HEADERS:
+        response.headers[QUERY_COUNT_HEADER] = str(stats.count)
+        response.headers[QUERY_TIME_HEADER] = f"{db_ms:.1f}"
+    return response
+
 
 # CORS origins: from env or defaults for dev
 cors_origins_env = os.getenv("CORS_ORIGINS", "")
@@ -40,6 +162,8 @@ else:
         "http://localhost:5173",
     ]
 
+# Registered last so it is the outermost middleware: responses produced by
+# the middlewares above (e.g. the rate limiter's 429) get CORS headers too.
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
@@ -48,6 +172,12 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus scrape endpoint. Internal: nginx only proxies /api/."""
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
 def is_valid_timezone(tz_str: str) -> bool:
     """Validate if timezone string is a valid IANA timezone."""
     try:
@@ -63,6 +193,7 @@ class TaskSchedule(BaseModel):
     text: str
     iso_datetime: str
     timezone: str
+    recurrence: Optional[str] = None  # RRULE, e.g. "FREQ=WEEKLY;BYDAY=MO"
 
 class TaskResponse(BaseModel):
     id: int
@@ -81,6 +212,7 @@ class TaskUpdate(BaseModel):
     description: Optional[str] = None
     status: Optional[str] = None
     due_date: Optional[str] = None
+    recurrence: Optional[str] = None  # RRULE; an empty string stops the series
 
 class ProcessRequest(BaseModel):
     telegram_id: int
@@ -96,10 +228,32 @@ class TimezoneUpdate(BaseModel):
 
 def get_db():
     db_session = SessionLocal()
+    started = time.perf_counter()
+    try:
+        yield db_session
+    finally:
+        db_session.close()
+        DB_SESSION_DURATION.observe(time.perf_counter() - started)
+
+
+def _read_session(telegram_id: int):
+    db_session = read_session_factory(telegram_id)()
+    started = time.perf_counter()
     try:
         yield db_session
     finally:
         db_session.close()
+        DB_SESSION_DURATION.observe(time.perf_counter() - started)
+
+
+def get_read_db(auth: AuthResult = Depends(get_auth_flexible)):
+    """Session for read-only endpoints: replica, or primary right after the user wrote."""
+    yield from _read_session(auth.telegram_id)
+
+
+def get_mini_app_read_db(tg_user: TelegramUser = Depends(get_telegram_user)):
+    """get_read_db for Mini App-only endpoints."""
+    yield from _read_session(tg_user.id)
 
 @app.post("/api/users/register")
 async def register_user(
@@ -112,25 +266,18 @@ async def register_user(
     - Mini App: Authorization: tma <initData>
     - Bot: Authorization: Bearer <INTERNAL_API_KEY> + telegram_id query param
     """
-    existing_user = db.query(models.User).filter(models.User.telegram_id == auth.telegram_id).first()
+    user, created = upsert_user(db, auth.telegram_id)
 
-    if existing_user:
-        return {"message": "User exists", "user_id": existing_user.id}
+    if not created:
+        return {"message": "User exists", "user_id": user.id}
 
-    # Create new user
-    new_user = models.User(
-        telegram_id=auth.telegram_id,
-    )
-    db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
-    return {"message": "User created", "user_id": new_user.id}
+    return {"message": "User created", "user_id": user.id}
 
 
 @app.get("/api/users/me")
 async def get_current_user(
     auth: AuthResult = Depends(get_auth_flexible),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
 ):
     """Get current user data including timezone.
 
@@ -138,7 +285,7 @@ async def get_current_user(
     - Mini App: Authorization: tma <initData>
     - Bot: Authorization: Bearer <INTERNAL_API_KEY> + telegram_id query param
     """
-    user = db.query(models.User).filter(models.User.telegram_id == auth.telegram_id).first()
+    user = get_cached_user(db, auth.telegram_id)
 
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
@@ -146,10 +293,24 @@ async def get_current_user(
     return {
         "telegram_id": user.telegram_id,
         "timezone": user.timezone,
-        "google_calendar_connected": bool(user.google_calendar_token)
+        "google_calendar_connected": user.calendar_connected
     }
 
 
+@app.get("/api/users/me/stats")
+async def get_current_user_stats(
+    auth: AuthResult = Depends(get_auth_flexible),
+    db: Session = Depends(get_read_db),
+):
+    """Task counters for the current user: upcoming, overdue, completed this week, completion rate."""
+    user = get_cached_user(db, auth.telegram_id)
+
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    return stats.get_user_stats(db, user.id, user.timezone)
+
+
 @app.put("/api/users/timezone")
 async def set_user_timezone(
     update: TimezoneUpdate,
@@ -169,16 +330,8 @@ async def set_user_timezone(
     if not is_valid_timezone(tz):
         raise HTTPException(status_code=400, detail=f"Invalid timezone: {tz}. Use IANA timezone format (e.g., Europe/Moscow)")
 
-    user = db.query(models.User).filter(models.User.telegram_id == auth.telegram_id).first()
-
-    if not user:
-        user = models.User(telegram_id=auth.telegram_id, timezone=tz)
-        db.add(user)
-    else:
-        user.timezone = tz
-
-    db.commit()
-    db.refresh(user)
+    user, _ = upsert_user(db, auth.telegram_id, tz)
+    mark_user_write(auth.telegram_id)
 
     return {"message": "Timezone updated", "timezone": user.timezone}
 
@@ -187,21 +340,22 @@ async def set_user_timezone(
 async def schedule_task(
     task: TaskSchedule,
     _: bool = Depends(verify_internal_api_key),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
     db: Session = Depends(get_db)
 ):
     logging.info(f"Received task: {task} for telegram_id: {task.telegram_id}")
 
-    user = db.query(models.User).filter(models.User.telegram_id == task.telegram_id).first()
-    if not user:
-        user = models.User(telegram_id=task.telegram_id, timezone=task.timezone)
-        db.add(user)
-        db.commit()
-        db.refresh(user)
-    elif user.timezone != task.timezone:
-        user.timezone = task.timezone
-        db.commit()
+    recurrence = normalize_rule(task.recurrence)
+    if task.recurrence and task.recurrence.strip() and recurrence is None:
+        raise HTTPException(status_code=400, detail="Неверное правило повторения")
+
+    replay = idempotency.begin("schedule", idempotency_key)
+    if replay is not None:
+        return replay
 
     try:
+        user = ensure_user(db, task.telegram_id, task.timezone)
+
         eta = datetime.fromisoformat(task.iso_datetime)
         if eta.tzinfo is None:
             eta = eta.replace(tzinfo=timezone.utc)
@@ -213,56 +367,169 @@ async def schedule_task(
             message_id=task.message_id,
             chat_id=task.chat_id,
             status=TaskStatus.CREATED,
+            recurrence=recurrence,
         )
         db.add(new_task)
         db.commit()
         db.refresh(new_task)
-        
-        return {"message": "Задача запланирована", "task_id": new_task.id}
+        mark_user_write(task.telegram_id)
+        publish_task_event(task.telegram_id, "created", new_task, user.timezone)
+        stats.record_transition(user.id, None, new_task.status)
+
+        result = {"message": "Задача запланирована", "task_id": new_task.id}
+        idempotency.complete("schedule", idempotency_key, result)
+        return result
 
     except ValueError:
+        idempotency.release("schedule", idempotency_key)
         logging.error(f"Could not parse ISO datetime: {task.iso_datetime}")
         raise HTTPException(status_code=400, detail="Неверный формат даты.")
+    except Exception:
+        idempotency.release("schedule", idempotency_key)
+        raise
 
 @app.post("/api/process-async")
 async def process_async(
     request: ProcessRequest,
-    _: bool = Depends(verify_internal_api_key)
+    _: bool = Depends(verify_internal_api_key),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
 ):
+    # A retried request replays the stored response instead of paying for a second LLM call
+    replay = idempotency.begin("process-async", idempotency_key)
+    if replay is not None:
+        return replay
+
+    # Backpressure: refuse new LLM work rather than queueing it behind a long backlog
+    if rate_limit.llm_queue_busy():
+        idempotency.release("process-async", idempotency_key)
+        raise HTTPException(
+            status_code=503,
+            detail="busy",
+            headers={"Retry-After": str(LLM_BUSY_RETRY_AFTER_SECONDS)},
+        )
+
+    allowed, retry_after = rate_limit.acquire(rate_limit.llm_bucket(request.telegram_id))
+    if not allowed:
+        idempotency.release("process-async", idempotency_key)
+        raise HTTPException(
+            status_code=429,
+            detail="rate_limited",
+            headers={"Retry-After": str(math.ceil(retry_after))},
+        )
+
     from .tasks import process_llm_request
-    process_llm_request.delay(
-        telegram_id=request.telegram_id,
-        chat_id=request.chat_id,
-        message_id=request.message_id,
-        text=request.text,
-        timezone_str=request.timezone,
-    )
-    return {"message": "Запрос принят в обработку"}
+    try:
+        process_llm_request.delay(
+            telegram_id=request.telegram_id,
+            chat_id=request.chat_id,
+            message_id=request.message_id,
+            text=request.text,
+            timezone_str=request.timezone,
+        )
+    except Exception:
+        idempotency.release("process-async", idempotency_key)
+        raise
+
+    result = {"message": "Запрос принят в обработку"}
+    idempotency.complete("process-async", idempotency_key, result)
+    return result
+
+def _task_list_query(model, user_id: int, limit: int, before_due: Optional[datetime], before_id: Optional[int]):
+    """One branch of the task list: a user's rows from `tasks` or `tasks_archive`, newest due first."""
+    query = select(
+        model.id,
+        model.description,
+        model.due_date,
+        model.status,
+        model.created_at,
+        model.completed_at,
+    ).where(model.user_id == user_id)
+    if before_due is not None and before_id is not None:
+        query = query.where(tuple_(model.due_date, model.id) < (before_due, before_id))
+    return query.order_by(model.due_date.desc(), model.id.desc()).limit(limit)
+
 
 @app.get("/api/tasks", response_model=List[TaskResponse])
 async def get_tasks(
+    request: Request,
+    limit: int = Query(TASKS_PAGE_SIZE, ge=1, le=TASKS_PAGE_SIZE_MAX),
+    before_due: Optional[datetime] = Query(None, description="due_date of the last task on the previous page"),
+    before_id: Optional[int] = Query(None, description="id of the last task on the previous page"),
     tg_user: TelegramUser = Depends(get_telegram_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_mini_app_read_db)
 ):
-    user = db.query(models.User).filter(models.User.telegram_id == tg_user.id).first()
+    """
+    Tasks ordered by due_date desc, id desc, paged with a (before_due, before_id) keyset.
+
+    Archived tasks continue seamlessly after the live ones; each branch is limited
+    on its own index before the merge.
+    """
+    # Returns a pre-encoded Response: response_model only documents the shape,
+    # rows are fetched as tuples and never go through Pydantic.
+    user = get_cached_user(db, tg_user.id)
     if not user:
-        return []
-
-    tasks = db.query(models.Task).filter(models.Task.user_id == user.id).order_by(models.Task.due_date.desc()).all()
-
-    return [
-        TaskResponse(
-            id=t.id,
-            description=t.description,
-            due_date=t.due_date.isoformat() if t.due_date else "",
-            display_date=format_user_time(t.due_date, user.timezone) if t.due_date else "",
-            status=t.status.value,
-            created_at=t.created_at.isoformat() if t.created_at else "",
-            completed_at=t.completed_at.isoformat() if t.completed_at else None,
-            display_completed_at=format_user_time(t.completed_at, user.timezone) if t.completed_at and user.timezone else None,
-        )
-        for t in tasks
-    ]
+        return json_response(request, [])
+
+    # Each limited branch is wrapped in its own subquery, which every dialect accepts in a UNION
+    merged = union_all(*(
+        select(_task_list_query(model, user.id, limit, before_due, before_id).subquery())
+        for model in (models.Task, models.ArchivedTask)
+    )).subquery()
+    rows = db.execute(
+        select(merged).order_by(merged.c.due_date.desc(), merged.c.id.desc()).limit(limit)
+    ).all()
+
+    return json_response(request, task_rows_to_dicts(rows, user.timezone))
+
+
+@app.get("/api/tasks/agenda")
+async def get_agenda(
+    request: Request,
+    per_bucket: int = Query(AGENDA_PER_BUCKET, ge=1, le=AGENDA_PER_BUCKET_MAX),
+    tg_user: TelegramUser = Depends(get_telegram_user),
+    db: Session = Depends(get_mini_app_read_db)
+):
+    """Open tasks grouped into overdue/today/tomorrow/later with per-bucket counts."""
+    user = get_cached_user(db, tg_user.id)
+    if not user:
+        return json_response(request, agenda.empty_agenda())
+
+    return json_response(request, agenda.get_agenda(db, user.id, user.timezone, per_bucket))
+
+
+@app.get("/api/tasks/search", response_model=List[TaskResponse])
+async def search_tasks(
+    request: Request,
+    q: str = Query(..., min_length=2, max_length=200),
+    limit: int = Query(SEARCH_PAGE_SIZE, ge=1, le=SEARCH_PAGE_SIZE_MAX),
+    offset: int = Query(0, ge=0),
+    tg_user: TelegramUser = Depends(get_telegram_user),
+    db: Session = Depends(get_mini_app_read_db)
+):
+    """Live and archived tasks matching `q`, best match first."""
+    user = get_cached_user(db, tg_user.id)
+    if not user:
+        return json_response(request, [])
+
+    rows = search.search_tasks(db, user.id, q, limit, offset)
+    return json_response(request, task_rows_to_dicts(rows, user.timezone))
+
+
+@app.get("/api/tasks/events")
+async def task_events(
+    request: Request,
+    tg_user: TelegramUser = Depends(get_telegram_user),
+):
+    """Server-Sent Events stream of the user's task changes (created/updated/sent)."""
+    return StreamingResponse(
+        stream_task_events(tg_user.id, request.is_disconnected),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            # Stop nginx from buffering the stream
+            "X-Accel-Buffering": "no",
+        },
+    )
 
 @app.get("/api/tasks/{task_id}", response_model=TaskResponse)
 async def get_task(
@@ -270,7 +537,7 @@ async def get_task(
     user_id: int = Depends(get_user_id_flexible),
     db: Session = Depends(get_db)
 ):
-    task = db.query(models.Task).filter(models.Task.id == task_id).first()
+    task = db.query(models.Task).options(joinedload(models.Task.user)).filter(models.Task.id == task_id).first()
     if not task:
         raise HTTPException(status_code=404, detail="Задача не найдена")
 
@@ -297,7 +564,12 @@ async def update_task(
     user_id: int = Depends(get_user_id_flexible),
     db: Session = Depends(get_db)
 ):
-    task = db.query(models.Task).filter(models.Task.id == task_id).first()
+    task = db.query(models.Task).options(joinedload(models.Task.user)).filter(models.Task.id == task_id).first()
+    if not task:
+        # Old tasks are archived, but the Mini App and old notification buttons may still update them
+        from .tasks import restore_archived_task
+        if restore_archived_task(db, task_id, user_id):
+            task = db.query(models.Task).options(joinedload(models.Task.user)).filter(models.Task.id == task_id).first()
     if not task:
         raise HTTPException(status_code=404, detail="Задача не найдена")
 
@@ -306,6 +578,10 @@ async def update_task(
         raise HTTPException(status_code=403, detail="Доступ запрещен")
 
     old_status = task.status
+    old_completed_at = task.completed_at
+    # The user row is not written here; read what is needed once, before the commits expire it
+    timezone_str = task.user.timezone
+    calendar_token = task.user.google_calendar_token
 
     if update.description is not None:
         task.description = update.description
@@ -329,27 +605,37 @@ async def update_task(
         except ValueError:
              raise HTTPException(status_code=400, detail="Неверная дата")
 
+    if update.recurrence is not None:
+        recurrence = normalize_rule(update.recurrence)
+        if update.recurrence.strip() and recurrence is None:
+            raise HTTPException(status_code=400, detail="Неверное правило повторения")
+        task.recurrence = recurrence
+
+    # Completing an occurrence early still produces the next one
+    next_task = None
+    if task.status == TaskStatus.COMPLETED and old_status != TaskStatus.COMPLETED:
+        next_task = materialize_next(db, task, timezone_str, datetime.now(timezone.utc))
+
     db.commit()
     db.refresh(task)
+    if next_task:
+        db.refresh(next_task)
 
     # Schedule notification if task was snoozed (status changed to CREATED with future due_date)
     new_status = task.status
     if new_status == TaskStatus.CREATED and task.due_date:
-        from .tasks import send_task_notification
+        from .tasks import schedule_task_notification
         now = datetime.now(timezone.utc)
         delay_seconds = (task.due_date - now).total_seconds()
         if 0 <= delay_seconds <= 300:  # Due within 5 minutes
-            send_task_notification.apply_async(
-                args=[task.id],
-                countdown=delay_seconds
-            )
-            task.status = TaskStatus.SCHEDULED
+            schedule_task_notification(task, now)
             db.commit()
+            db.refresh(task)
 
     # Handle Google Calendar sync
-    if task.google_calendar_event_id and task.user and task.user.google_calendar_token:
+    if task.google_calendar_event_id and calendar_token:
         try:
-            token_data = json.loads(task.user.google_calendar_token)
+            token_data = json.loads(calendar_token)
             new_status = task.status
 
             if new_status == TaskStatus.COMPLETED:
@@ -363,6 +649,19 @@ async def update_task(
         except Exception as e:
             logging.error(f"Error syncing with Google Calendar: {e}")
 
+    mark_user_write(user_id)
+    publish_task_event(user_id, "updated", task, timezone_str)
+    if next_task:
+        publish_task_event(user_id, "created", next_task, timezone_str)
+        stats.record_transition(task.user_id, None, next_task.status)
+    stats.record_transition(
+        task.user_id,
+        old_status,
+        task.status,
+        timezone_str,
+        completed_at=task.completed_at if task.status == TaskStatus.COMPLETED else old_completed_at,
+    )
+
     return {
         "message": "Задача обновлена",
         "task": {
@@ -370,7 +669,7 @@ async def update_task(
             "description": task.description,
             "status": task.status.value,
             "due_date": task.due_date.isoformat() if task.due_date else None,
-            "display_date": format_user_time(task.due_date, task.user.timezone) if task.due_date and task.user else ""
+            "display_date": format_user_time(task.due_date, timezone_str) if task.due_date else ""
         }
     }
 
@@ -408,7 +707,7 @@ async def google_auth(
     telegram_id = int(telegram_id_str)
 
     # Verify user exists
-    user = db.query(models.User).filter(models.User.telegram_id == telegram_id).first()
+    user = get_cached_user(db, telegram_id)
     if not user:
         raise HTTPException(status_code=404, detail="Пользователь не найден. Сначала отправьте /start боту.")
 
@@ -451,6 +750,8 @@ async def google_callback(
 
         user.google_calendar_token = json.dumps(tokens)
         db.commit()
+        invalidate_user(telegram_id)
+        mark_user_write(telegram_id)
 
         logging.info(f"Google Calendar connected for user {telegram_id}")
         return RedirectResponse(url=f"https://t.me/{BOT_USERNAME}?start=calendar_connected")
@@ -461,14 +762,14 @@ async def google_callback(
 
 @app.get("/api/google/status")
 async def google_status(
-    user_id: int = Depends(get_user_id_flexible),
-    db: Session = Depends(get_db)
+    auth: AuthResult = Depends(get_auth_flexible),
+    db: Session = Depends(get_read_db)
 ):
     """Check if user has connected Google Calendar."""
-    user = db.query(models.User).filter(models.User.telegram_id == user_id).first()
+    user = get_cached_user(db, auth.telegram_id)
     if not user:
         return {"connected": False}
-    return {"connected": user.google_calendar_token is not None}
+    return {"connected": user.calendar_connected}
 
 
 @app.delete("/api/google/disconnect")
@@ -483,6 +784,8 @@ async def google_disconnect(
 
     user.google_calendar_token = None
     db.commit()
+    invalidate_user(user_id)
+    mark_user_write(user_id)
     return {"message": "Google Calendar отключен"}
 
 
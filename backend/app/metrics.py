@@ -0,0 +1,130 @@
+"""
+Prometheus metrics for the backend API and the Celery workers.
+
+The API serves its metrics on the internal /metrics route. Celery runs tasks
+in prefork child processes, so worker metrics are collected in
+prometheus_client multiprocess mode: set PROMETHEUS_MULTIPROC_DIR to a
+writable directory and the main worker process serves the aggregated
+values on METRICS_PORT. The directory has to exist and be empty before the
+worker imports this module; worker-entrypoint.sh takes care of that.
+"""
+
+import logging
+import os
+import time
+
+import redis
+from celery.signals import worker_init, worker_process_shutdown
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, start_http_server
+from prometheus_client import multiprocess
+from sqlalchemy import event
+
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9100"))
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+
+# Fine-grained at the low end so SLOs like "p99 lag < 2s" can be read off
+LAG_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+REMINDER_LAG = Histogram(
+    "reminder_lag_seconds",
+    "Delay between a task's due_date and its notification being sent",
+    ["kind"],
+    buckets=LAG_BUCKETS,
+)
+SWEEP_DURATION = Histogram(
+    "scheduler_sweep_duration_seconds",
+    "Wall time of one check_due_tasks run",
+)
+SWEEP_BATCH_SIZE = Histogram(
+    "scheduler_sweep_batch_size",
+    "Tasks handled by one check_due_tasks run, by stage",
+    ["stage"],
+    buckets=(0, 1, 5, 10, 50, 100, 500, 1000, 5000),
+)
+TELEGRAM_API_LATENCY = Histogram(
+    "telegram_api_latency_seconds",
+    "Latency of Telegram Bot API calls",
+    ["method"],
+)
+NOTIFICATIONS = Counter(
+    "notifications_total",
+    "Notification delivery attempts by outcome",
+    ["kind", "outcome"],
+)
+
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "Backend request latency by route template",
+    ["method", "route"],
+)
+HTTP_REQUESTS = Counter(
+    "http_requests_total",
+    "Backend requests by route template and status code",
+    ["method", "route", "status"],
+)
+HTTP_IN_FLIGHT = Gauge(
+    "http_requests_in_flight",
+    "Backend requests currently being served",
+    multiprocess_mode="livesum",
+)
+DB_SESSION_DURATION = Histogram(
+    "db_session_duration_seconds",
+    "Lifetime of a request-scoped DB session",
+)
+DB_CONNECTION_HELD = Histogram(
+    "db_pool_connection_held_seconds",
+    "Time between pool checkout and checkin of a DB connection",
+)
+DB_POOL_CHECKED_OUT = Gauge(
+    "db_pool_checked_out_connections",
+    "DB connections currently checked out of the pool",
+    multiprocess_mode="livesum",
+)
+REDIS_COMMAND_DURATION = Histogram(
+    "redis_command_duration_seconds",
+    "Latency of Redis commands",
+    ["command"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1),
+)
+
+
+class InstrumentedRedis(redis.Redis):
+    """redis.Redis that records the latency of every command."""
+
+    def execute_command(self, *args, **options):
+        with REDIS_COMMAND_DURATION.labels(command=str(args[0]).upper()).time():
+            return super().execute_command(*args, **options)
+
+
+def instrument_engine(engine) -> None:
+    """Track how long connections are held and how many are checked out."""
+
+    @event.listens_for(engine, "checkout")
+    def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+        connection_record.info["checked_out_at"] = time.perf_counter()
+        DB_POOL_CHECKED_OUT.inc()
+
+    @event.listens_for(engine, "checkin")
+    def _on_checkin(dbapi_connection, connection_record):
+        started = connection_record.info.pop("checked_out_at", None)
+        if started is not None:
+            DB_CONNECTION_HELD.observe(time.perf_counter() - started)
+            DB_POOL_CHECKED_OUT.dec()
+
+
+@worker_init.connect
+def _start_metrics_server(**kwargs):
+    if PROMETHEUS_MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        start_http_server(METRICS_PORT, registry=registry)
+    else:
+        logging.warning("PROMETHEUS_MULTIPROC_DIR not set, child process metrics will be missing")
+        start_http_server(METRICS_PORT)
+    logging.info(f"Metrics server listening on :{METRICS_PORT}")
+
+
+@worker_process_shutdown.connect
+def _mark_process_dead(pid=None, **kwargs):
+    if PROMETHEUS_MULTIPROC_DIR:
+        multiprocess.mark_process_dead(pid or os.getpid())
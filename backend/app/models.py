@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, BigInteger, String, DateTime, ForeignKey, Enum, Text
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, ForeignKey, Enum, Text, Index, func, text
 from sqlalchemy.orm import relationship, declarative_base
 from datetime import datetime, timezone
 import enum
@@ -11,6 +11,7 @@ class TaskStatus(enum.Enum):
     SCHEDULED = "scheduled"
     SENT = "sent"
     COMPLETED = "completed"
+    MISSED = "missed"
 
 
 class User(Base):
@@ -40,5 +41,50 @@ class Task(Base):
     message_id = Column(BigInteger, nullable=True)
     chat_id = Column(BigInteger, nullable=True)
     google_calendar_event_id = Column(String, nullable=True)  # Google Calendar event ID
+    lease_expires_at = Column(DateTime(timezone=True), nullable=True)  # When a SCHEDULED task's timer is considered lost
+    scheduled_at = Column(DateTime(timezone=True), nullable=True)  # When the notification was last queued
+    sent_at = Column(DateTime(timezone=True), nullable=True)  # When the notification was delivered
+    delivery_attempts = Column(Integer, nullable=False, default=0, server_default="0")
+    recurrence = Column(String, nullable=True)  # RRULE; only the next occurrence carries it
 
     user = relationship("User", back_populates="tasks")
+
+    __table_args__ = (
+        Index(
+            "ix_tasks_scheduled_lease",
+            "lease_expires_at",
+            postgresql_where=text("status = 'scheduled'"),
+        ),
+        # Keyset pagination in /api/tasks
+        Index("ix_tasks_user_due", "user_id", "due_date", "id"),
+        # archive_finished_tasks: finished tasks by age (migration 013; keep in sync with tasks._archive_batch)
+        Index(
+            "ix_tasks_finished_age",
+            text("coalesce(completed_at, sent_at, due_date)"),
+            postgresql_where=text("status IN ('sent', 'completed', 'missed')"),
+        ),
+    )
+
+
+class ArchivedTask(Base):
+    """Finished tasks moved out of `tasks` by the archive_finished_tasks job. Ids are preserved."""
+    __tablename__ = "tasks_archive"
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    user_id = Column(Integer, ForeignKey("users.id"))
+    description = Column(String)
+    due_date = Column(DateTime(timezone=True))
+    created_at = Column(DateTime(timezone=True))
+    completed_at = Column(DateTime(timezone=True), nullable=True)
+    status = Column(Enum(TaskStatus, values_callable=lambda obj: [e.value for e in obj]))
+    message_id = Column(BigInteger, nullable=True)
+    chat_id = Column(BigInteger, nullable=True)
+    google_calendar_event_id = Column(String, nullable=True)
+    sent_at = Column(DateTime(timezone=True), nullable=True)
+    delivery_attempts = Column(Integer, nullable=False, default=0, server_default="0")
+    archived_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+    __table_args__ = (
+        # Keyset pagination in /api/tasks
+        Index("ix_tasks_archive_user_due", "user_id", "due_date", "id"),
+    )
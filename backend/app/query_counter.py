@@ -0,0 +1,75 @@
+"""
+Per-request SQL statement counting.
+
+Engine events add every statement's count and duration to the QueryStats
+active in the current context. The backend middleware opens one per
+request, logs it, and (with QUERY_DEBUG_HEADERS=1) returns it in the
+X-DB-Query-Count / X-DB-Time-Ms response headers, which
+tests/test_query_budget.py checks against a budget per endpoint.
+"""
+
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Iterator, Optional
+
+from sqlalchemy import event
+
+QUERY_COUNT_HEADER = "X-DB-Query-Count"
+QUERY_TIME_HEADER = "X-DB-Time-Ms"
+
+
+@dataclass
+class QueryStats:
+    count: int = 0
+    duration: float = 0.0  # seconds
+    parent: Optional["QueryStats"] = None
+
+    def record(self, duration: float) -> None:
+        stats = self
+        while stats is not None:
+            stats.count += 1
+            stats.duration += duration
+            stats = stats.parent
+
+
+_current: ContextVar[Optional[QueryStats]] = ContextVar("query_stats", default=None)
+
+
+def instrument_engine_queries(engine) -> None:
+    """Attach the statement counter to an engine."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_started"].pop()
+        stats = _current.get()
+        if stats is not None:
+            stats.record(time.perf_counter() - started)
+
+
+@contextmanager
+def track_queries() -> Iterator[QueryStats]:
+    """Count statements executed in this context; nested trackers also count toward outer ones."""
+    stats = QueryStats(parent=_current.get())
+    token = _current.set(stats)
+    try:
+        yield stats
+    finally:
+        _current.reset(token)
+
+
+def assert_query_budget(response, budget: int) -> None:
+    """Check a test client response against a query budget (needs QUERY_DEBUG_HEADERS=1)."""
+    header = response.headers.get(QUERY_COUNT_HEADER)
+    if header is None:
+        raise AssertionError(f"{QUERY_COUNT_HEADER} header missing; set QUERY_DEBUG_HEADERS=1")
+    if int(header) > budget:
+        raise AssertionError(
+            f"{response.request.method} {response.request.url.path}: "
+            f"expected at most {budget} queries, got {header}"
+        )
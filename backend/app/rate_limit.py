@@ -0,0 +1,119 @@
+"""
+Redis token-bucket rate limiting.
+
+A single Lua script refills and checks any number of buckets atomically
+(e.g. a per-user and a global one), and only consumes tokens if every
+bucket allows the request. Redis server time is used, so all backend
+processes share one clock. Redis failures fail open.
+
+The bot carries its own copy of TOKEN_BUCKET_SCRIPT (telegram_bot/main.py);
+keep the two in sync.
+"""
+
+import logging
+import os
+from typing import NamedTuple
+
+import redis
+
+from .celery_app import LLM_QUEUE
+from .metrics import InstrumentedRedis
+
+REDIS_HOST = os.getenv("REDIS_HOST", "redis")
+
+# Every API request: per user and across all users
+RATE_LIMIT_USER_CAPACITY = int(os.getenv("RATE_LIMIT_USER_CAPACITY", "60"))
+RATE_LIMIT_USER_PER_SECOND = float(os.getenv("RATE_LIMIT_USER_PER_SECOND", "2"))
+RATE_LIMIT_GLOBAL_CAPACITY = int(os.getenv("RATE_LIMIT_GLOBAL_CAPACITY", "500"))
+RATE_LIMIT_GLOBAL_PER_SECOND = float(os.getenv("RATE_LIMIT_GLOBAL_PER_SECOND", "200"))
+# LLM requests (/api/process-async) per user: a burst of 5, then one per 10s
+RATE_LIMIT_LLM_CAPACITY = int(os.getenv("RATE_LIMIT_LLM_CAPACITY", "5"))
+RATE_LIMIT_LLM_PER_SECOND = float(os.getenv("RATE_LIMIT_LLM_PER_SECOND", "0.1"))
+# Above this many pending LLM jobs the backend reports "busy" instead of enqueueing
+LLM_QUEUE_BUSY_THRESHOLD = int(os.getenv("LLM_QUEUE_BUSY_THRESHOLD", "200"))
+
+# KEYS: bucket keys. ARGV: cost, then capacity and refill-per-second for each key.
+# Returns {allowed (0/1), seconds until retry as a string}.
+TOKEN_BUCKET_SCRIPT = """
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local cost = tonumber(ARGV[1])
+local levels = {}
+local retry_after = 0
+
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[i * 2])
+    local rate = tonumber(ARGV[i * 2 + 1])
+    local state = redis.call('HMGET', key, 'tokens', 'ts')
+    local tokens = tonumber(state[1]) or capacity
+    local ts = tonumber(state[2]) or now
+    tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+    levels[i] = tokens
+    if tokens < cost then
+        retry_after = math.max(retry_after, (cost - tokens) / rate)
+    end
+end
+
+if retry_after > 0 then
+    return {0, tostring(retry_after)}
+end
+
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[i * 2])
+    local rate = tonumber(ARGV[i * 2 + 1])
+    redis.call('HSET', key, 'tokens', tostring(levels[i] - cost), 'ts', tostring(now))
+    redis.call('EXPIRE', key, math.ceil(capacity / rate) + 1)
+end
+return {1, '0'}
+"""
+
+redis_client = InstrumentedRedis(host=REDIS_HOST, port=6379, decode_responses=True)
+_token_bucket = redis_client.register_script(TOKEN_BUCKET_SCRIPT)
+
+
+class Bucket(NamedTuple):
+    key: str
+    capacity: int
+    per_second: float
+
+
+def user_bucket(identity: str) -> Bucket:
+    return Bucket(f"ratelimit:api:{identity}", RATE_LIMIT_USER_CAPACITY, RATE_LIMIT_USER_PER_SECOND)
+
+
+def global_bucket() -> Bucket:
+    return Bucket("ratelimit:api:global", RATE_LIMIT_GLOBAL_CAPACITY, RATE_LIMIT_GLOBAL_PER_SECOND)
+
+
+def llm_bucket(telegram_id: int) -> Bucket:
+    return Bucket(f"ratelimit:llm:{telegram_id}", RATE_LIMIT_LLM_CAPACITY, RATE_LIMIT_LLM_PER_SECOND)
+
+
+def acquire(*buckets: Bucket, cost: int = 1) -> tuple[bool, float]:
+    """Take `cost` tokens from every bucket. Returns (allowed, retry_after_seconds)."""
+    args = [cost]
+    for bucket in buckets:
+        args.extend((bucket.capacity, bucket.per_second))
+    try:
+        allowed, retry_after = _token_bucket(keys=[b.key for b in buckets], args=args)
+    except redis.RedisError as e:
+        logging.error(f"Rate limiter unavailable, allowing request: {e}")
+        return True, 0.0
+    return bool(allowed), float(retry_after)
+
+
+def llm_queue_depth() -> int:
+    """Pending messages in the LLM queue, across its Redis priority sub-queues."""
+    try:
+        with redis_client.pipeline(transaction=False) as pipe:
+            pipe.llen(LLM_QUEUE)
+            for priority in range(1, 10):
+                pipe.llen(f"{LLM_QUEUE}:{priority}")
+            return sum(pipe.execute())
+    except redis.RedisError as e:
+        logging.error(f"Error reading LLM queue depth: {e}")
+        return 0
+
+
+def llm_queue_busy() -> bool:
+    return llm_queue_depth() >= LLM_QUEUE_BUSY_THRESHOLD
@@ -0,0 +1,147 @@
+"""
+Recurring reminders.
+
+A recurring task stores an RFC 5545 RRULE (e.g. "FREQ=DAILY",
+"FREQ=WEEKLY;BYDAY=MO"), produced once by llm_service when the task is
+created. Only one occurrence exists at a time: when it is sent, completed or
+marked missed, materialize_next() inserts the following occurrence and moves
+the rule onto it, so a task never spawns twice and no future rows pile up.
+Since every occurrence anchors the rule anew, COUNT is carried forward as the
+number of occurrences left.
+
+Occurrences are computed in the user's local wall-clock time and only then
+converted to UTC, so "every day at 9:00" stays at 9:00 across DST changes.
+"""
+
+import logging
+from datetime import datetime, timezone
+from typing import Optional
+
+from dateutil.rrule import rrulestr
+
+from . import models
+from .models import TaskStatus
+from .utils import get_zone
+
+
+def _rule_parts(rule: str) -> list[tuple[str, str]]:
+    return [(key.upper(), value) for key, _, value in (part.partition("=") for part in rule.split(";") if part)]
+
+
+def _join_parts(parts: list[tuple[str, str]]) -> str:
+    return ";".join(f"{key}={value}" for key, value in parts)
+
+
+def _local_rule(rule: str, zone) -> str:
+    """
+    The rule with a UTC UNTIL converted to naive local time.
+
+    Series are expanded from a naive local dtstart, and dateutil rejects a
+    UTC ("...Z") UNTIL next to one.
+    """
+    parts = []
+    for key, value in _rule_parts(rule):
+        if key == "UNTIL" and value.upper().endswith("Z"):
+            until = datetime.strptime(value[:-1], "%Y%m%dT%H%M%S").replace(tzinfo=timezone.utc)
+            value = until.astimezone(zone).strftime("%Y%m%dT%H%M%S")
+        parts.append((key, value))
+    return _join_parts(parts)
+
+
+def _split_count(rule: str) -> tuple[str, Optional[int]]:
+    """The rule without COUNT, and COUNT itself (None for open-ended series)."""
+    parts = _rule_parts(rule)
+    count = next((int(value) for key, value in parts if key == "COUNT"), None)
+    return _join_parts([(key, value) for key, value in parts if key != "COUNT"]), count
+
+
+def _parse(rule: str, dtstart: datetime, zone=timezone.utc):
+    return rrulestr(_local_rule(rule, zone), dtstart=dtstart, forceset=False)
+
+
+def normalize_rule(rule: Optional[str]) -> Optional[str]:
+    """The rule without an "RRULE:" prefix if dateutil accepts it, else None."""
+    if not rule:
+        return None
+    rule = rule.strip()
+    if rule.upper().startswith("RRULE:"):
+        rule = rule[6:]
+    try:
+        _split_count(rule)
+        _parse(rule, datetime(2000, 1, 1))
+    except (ValueError, TypeError) as e:
+        logging.warning(f"Ignoring invalid recurrence rule {rule!r}: {e}")
+        return None
+    return rule
+
+
+def next_occurrence(
+    rule: str, due_date: datetime, timezone_str: Optional[str], after: datetime
+) -> Optional[tuple[datetime, str]]:
+    """
+    The occurrence following `due_date` (the current one) that is strictly after `after`, in UTC.
+
+    Returned with the rule the new occurrence carries: COUNT counts the
+    occurrences left including the current one, so it drops by one for the
+    current occurrence and one for every occurrence skipped as past. None
+    when the series is over.
+    """
+    zone = get_zone(timezone_str) if timezone_str else None
+    zone = zone or timezone.utc
+
+    # Work on naive local times: rrule then steps in wall-clock days, and
+    # attaching the zone afterwards picks the right UTC offset for each date.
+    local_start = due_date.astimezone(zone).replace(tzinfo=None)
+    local_after = after.astimezone(zone).replace(tzinfo=None)
+    try:
+        open_rule, count = _split_count(rule)
+        series = _parse(open_rule, local_start, zone)
+        if count is None:
+            local_next = series.after(local_after)
+            next_rule = rule
+        else:
+            # COUNT is applied here rather than by dateutil, which does not
+            # count a dtstart that does not match the rule
+            upcoming = list(series.xafter(local_start, count=count - 1)) if count > 1 else []
+            remaining = [occurrence for occurrence in upcoming if occurrence > local_after]
+            local_next = remaining[0] if remaining else None
+            next_rule = _join_parts([
+                (key, str(len(remaining)) if key == "COUNT" else value) for key, value in _rule_parts(rule)
+            ])
+    except (ValueError, TypeError) as e:
+        logging.error(f"Cannot expand recurrence rule {rule!r}: {e}")
+        return None
+    if local_next is None:
+        return None
+    return local_next.replace(tzinfo=zone).astimezone(timezone.utc), next_rule
+
+
+def materialize_next(db, task: models.Task, timezone_str: Optional[str], now: datetime) -> Optional[models.Task]:
+    """
+    Add the occurrence after `task` to the session and hand the rule over to it.
+
+    Past occurrences are skipped. The caller commits. Returns None for
+    non-recurring tasks and for finished series (COUNT/UNTIL reached).
+    """
+    if not task.recurrence:
+        return None
+
+    rule = task.recurrence
+    task.recurrence = None
+    occurrence = next_occurrence(rule, task.due_date, timezone_str, max(now, task.due_date))
+    if occurrence is None:
+        logging.info(f"Recurring series of task {task.id} has ended")
+        return None
+    due_date, next_rule = occurrence
+
+    next_task = models.Task(
+        user_id=task.user_id,
+        description=task.description,
+        due_date=due_date,
+        chat_id=task.chat_id,
+        status=TaskStatus.CREATED,
+        recurrence=next_rule,
+    )
+    db.add(next_task)
+    logging.info(f"Task {task.id} recurs at {due_date.isoformat()}")
+    return next_task
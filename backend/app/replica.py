@@ -0,0 +1,49 @@
+"""
+Read-replica routing with read-your-writes.
+
+Read-only endpoints use the replica when DATABASE_REPLICA_URL is set. A user
+who has just written something is pinned to the primary for
+READ_YOUR_WRITES_SECONDS, so replication lag never shows them stale data.
+The pin is a Redis key with a TTL. Writers call mark_user_write() after
+committing. Pins are recorded even by processes without a replica configured
+(the Celery workers): the API that serves the next read may have one.
+"""
+
+import logging
+import os
+
+import redis
+
+from .db import ReplicaSessionLocal, SessionLocal
+from .metrics import InstrumentedRedis
+
+REDIS_HOST = os.getenv("REDIS_HOST", "redis")
+READ_YOUR_WRITES_SECONDS = int(os.getenv("READ_YOUR_WRITES_SECONDS", "10"))
+
+redis_client = InstrumentedRedis(host=REDIS_HOST, port=6379, decode_responses=True)
+
+
+def _pin_key(telegram_id: int) -> str:
+    return f"read_primary:{telegram_id}"
+
+
+def mark_user_write(telegram_id: int) -> None:
+    """Route this user's reads to the primary for the read-your-writes window."""
+    try:
+        redis_client.set(_pin_key(telegram_id), "1", ex=READ_YOUR_WRITES_SECONDS)
+    except redis.RedisError as e:
+        logging.error(f"Error pinning {telegram_id} to primary: {e}")
+
+
+def read_session_factory(telegram_id: int):
+    """Pick the sessionmaker for a read-only request by this user."""
+    if ReplicaSessionLocal is None:
+        return SessionLocal
+    try:
+        if redis_client.exists(_pin_key(telegram_id)):
+            return SessionLocal
+    except redis.RedisError as e:
+        # Can't tell whether the user just wrote: the primary is always correct
+        logging.error(f"Error checking primary pin for {telegram_id}: {e}")
+        return SessionLocal
+    return ReplicaSessionLocal
@@ -0,0 +1,72 @@
+"""
+Fast JSON responses for large payloads.
+
+Bypasses FastAPI's response_model re-validation and stdlib json: content is
+encoded straight to bytes with orjson and compressed when the payload is
+big enough and the client accepts it (brotli preferred over gzip).
+"""
+
+import gzip
+import os
+from typing import Optional
+
+import brotli
+import orjson
+from fastapi import Request, Response
+
+from .utils import format_user_times
+
+COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", "1024"))  # bytes
+
+
+def _accepted_encodings(request: Request) -> set[str]:
+    header = request.headers.get("accept-encoding", "")
+    encodings = set()
+    for part in header.split(","):
+        token, _, params = part.strip().partition(";")
+        if params.replace(" ", "") in ("q=0", "q=0.0"):
+            continue
+        encodings.add(token.strip().lower())
+    return encodings
+
+
+def json_response(request: Request, content, status_code: int = 200) -> Response:
+    """Serialize content with orjson and negotiate compression."""
+    body = orjson.dumps(content)
+    headers = {"Vary": "Accept-Encoding"}
+
+    if len(body) >= COMPRESS_MIN_SIZE:
+        accepted = _accepted_encodings(request)
+        if "br" in accepted:
+            body = brotli.compress(body, quality=4)
+            headers["Content-Encoding"] = "br"
+        elif "gzip" in accepted:
+            body = gzip.compress(body, compresslevel=5)
+            headers["Content-Encoding"] = "gzip"
+
+    return Response(content=body, status_code=status_code, headers=headers, media_type="application/json")
+
+
+def task_rows_to_dicts(rows, timezone_str: Optional[str]) -> list[dict]:
+    """Build TaskResponse-shaped dicts from (id, description, due_date, status, created_at, completed_at) rows."""
+    # Format each datetime column in one pass with the timezone resolved once
+    display_dates = format_user_times((row[2] for row in rows), timezone_str)
+    if timezone_str:
+        display_completed = format_user_times((row[5] for row in rows), timezone_str)
+    else:
+        display_completed = [""] * len(rows)
+
+    return [
+        {
+            "id": task_id,
+            "description": description,
+            "due_date": due_date.isoformat() if due_date else "",
+            "display_date": display_date,
+            "status": status.value,
+            "created_at": created_at.isoformat() if created_at else "",
+            "completed_at": completed_at.isoformat() if completed_at else None,
+            "display_completed_at": display_completed_at or None,
+        }
+        for (task_id, description, due_date, status, created_at, completed_at), display_date, display_completed_at
+        in zip(rows, display_dates, display_completed)
+    ]
@@ -0,0 +1,61 @@
+"""
+Task search.
+
+Full-text search over Task.description with the 'russian' configuration
+(stemming, so "купить" finds "купи молоко"), OR'ed with pg_trgm word
+similarity for typos and partial words. Live and archived tasks are searched
+together. Both conditions are backed by GIN indexes on each table (migration
+011); the tsvector expression here must stay identical to the indexed one.
+"""
+
+from sqlalchemy import String, func, literal, literal_column, select, union_all
+from sqlalchemy.orm import Session
+
+from . import models
+
+SEARCH_CONFIG = literal_column("'russian'::regconfig")
+
+
+def _document(model):
+    return func.to_tsvector(SEARCH_CONFIG, func.coalesce(model.description, ""))
+
+
+def _search_query(model, user_id: int, text: str):
+    query = func.websearch_to_tsquery(SEARCH_CONFIG, text)
+    document = _document(model)
+    # Trigram similarity breaks ties and ranks fuzzy-only matches below stemmed ones
+    rank = func.ts_rank_cd(document, query) + func.word_similarity(text, func.coalesce(model.description, "")) * 0.1
+    return select(
+        model.id,
+        model.description,
+        model.due_date,
+        model.status,
+        model.created_at,
+        model.completed_at,
+        rank.label("rank"),
+    ).where(
+        model.user_id == user_id,
+        document.op("@@")(query) | literal(text, String).op("<%")(model.description),
+    )
+
+
+def search_tasks(db: Session, user_id: int, text: str, limit: int, offset: int = 0):
+    """Matching tasks of one user, best match first, as TaskResponse-shaped rows."""
+    merged = union_all(
+        _search_query(models.Task, user_id, text),
+        _search_query(models.ArchivedTask, user_id, text),
+    ).subquery()
+    statement = (
+        select(
+            merged.c.id,
+            merged.c.description,
+            merged.c.due_date,
+            merged.c.status,
+            merged.c.created_at,
+            merged.c.completed_at,
+        )
+        .order_by(merged.c.rank.desc(), merged.c.due_date.desc(), merged.c.id.desc())
+        .limit(limit)
+        .offset(offset)
+    )
+    return db.execute(statement).all()
@@ -0,0 +1,183 @@
+"""
+Per-user task statistics.
+
+Counters live in a Redis hash per user (`user_stats:{user_id}`) and are
+adjusted on every status transition, so /api/users/me/stats is one HGETALL.
+Each status falls into one bucket:
+
+    upcoming   created, scheduled
+    overdue    sent, missed (due date passed, not completed)
+    completed  completed; also counted per ISO week in the user's timezone
+
+Transitions are only applied to a hash that already exists. A missing hash
+is rebuilt from the database on the next read, and the periodic
+reconcile_user_stats task rebuilds all of them to correct drift.
+Archived tasks count like live ones.
+"""
+
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, Optional
+
+import redis
+from sqlalchemy import func, select, union_all
+from sqlalchemy.orm import Session
+
+from . import models
+from .metrics import InstrumentedRedis
+from .models import TaskStatus
+from .utils import get_zone
+
+REDIS_HOST = os.getenv("REDIS_HOST", "redis")
+USER_STATS_TTL = int(os.getenv("USER_STATS_TTL", str(7 * 86400)))
+
+STATUS_BUCKETS = {
+    TaskStatus.CREATED: "upcoming",
+    TaskStatus.SCHEDULED: "upcoming",
+    TaskStatus.SENT: "overdue",
+    TaskStatus.MISSED: "overdue",
+    TaskStatus.COMPLETED: "completed",
+}
+
+# KEYS[1]: stats hash. ARGV: field, delta pairs. No-op when the hash is absent,
+# so a partial hash is never created from increments alone.
+_INCREMENT_IF_EXISTS = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+for i = 1, #ARGV, 2 do
+    redis.call('HINCRBY', KEYS[1], ARGV[i], ARGV[i + 1])
+end
+return 1
+"""
+
+redis_client = InstrumentedRedis(host=REDIS_HOST, port=6379, decode_responses=True)
+_increment = redis_client.register_script(_INCREMENT_IF_EXISTS)
+
+
+def _key(user_id: int) -> str:
+    return f"user_stats:{user_id}"
+
+
+def week_field(completed_at: datetime, timezone_str: Optional[str]) -> str:
+    """Hash field counting completions in the ISO week of `completed_at`, in the user's timezone."""
+    zone = get_zone(timezone_str) if timezone_str else None
+    local = completed_at.astimezone(zone) if zone else completed_at
+    year, week, _ = local.isocalendar()
+    return f"completed:{year}-W{week:02d}"
+
+
+def record_transition(
+    user_id: int,
+    old_status: Optional[TaskStatus],
+    new_status: Optional[TaskStatus],
+    timezone_str: Optional[str] = None,
+    completed_at: Optional[datetime] = None,
+    count: int = 1,
+) -> None:
+    """
+    Move `count` tasks of one user from old_status to new_status (None = created / gone).
+
+    `completed_at` is required when either side is COMPLETED, to update that week's counter.
+    """
+    old_bucket = STATUS_BUCKETS.get(old_status)
+    new_bucket = STATUS_BUCKETS.get(new_status)
+    if old_bucket == new_bucket or not count:
+        return
+
+    deltas: dict[str, int] = {}
+    if old_bucket:
+        deltas[old_bucket] = -count
+    if new_bucket:
+        deltas[new_bucket] = count
+    if completed_at is not None and "completed" in deltas:
+        deltas[week_field(completed_at, timezone_str)] = deltas["completed"]
+
+    args = [item for field, delta in deltas.items() for item in (field, delta)]
+    try:
+        _increment(keys=[_key(user_id)], args=args)
+    except redis.RedisError as e:
+        # The next reconcile fixes the counters
+        logging.error(f"Error updating stats for user {user_id}: {e}")
+
+
+def _status_counts(db: Session, user_ids: Optional[Iterable[int]] = None):
+    """(user_id, status, count) over live and archived tasks."""
+    branches = []
+    for model in (models.Task, models.ArchivedTask):
+        query = select(model.user_id, model.status, func.count().label("n")).group_by(model.user_id, model.status)
+        if user_ids is not None:
+            query = query.where(model.user_id.in_(user_ids))
+        branches.append(query)
+    merged = union_all(*branches).subquery()
+    return db.execute(
+        select(merged.c.user_id, merged.c.status, func.sum(merged.c.n)).group_by(merged.c.user_id, merged.c.status)
+    ).all()
+
+
+def _recent_completions(db: Session, since: datetime, user_ids: Optional[Iterable[int]] = None):
+    """(user_id, timezone, completed_at) for tasks completed after `since`, live and archived."""
+    branches = []
+    for model in (models.Task, models.ArchivedTask):
+        query = (
+            select(model.user_id, models.User.timezone, model.completed_at)
+            .join(models.User, models.User.id == model.user_id)
+            .where(model.status == TaskStatus.COMPLETED, model.completed_at >= since)
+        )
+        if user_ids is not None:
+            query = query.where(model.user_id.in_(user_ids))
+        branches.append(query)
+    return db.execute(union_all(*branches)).all()
+
+
+def rebuild_stats(db: Session, user_ids: Optional[list[int]] = None) -> dict[int, dict[str, int]]:
+    """Recompute counters from the database and replace the hashes. None rebuilds every user with tasks."""
+    stats: dict[int, dict[str, int]] = {
+        user_id: {"upcoming": 0, "overdue": 0, "completed": 0} for user_id in (user_ids or [])
+    }
+    for user_id, status, count in _status_counts(db, user_ids):
+        counters = stats.setdefault(user_id, {"upcoming": 0, "overdue": 0, "completed": 0})
+        counters[STATUS_BUCKETS[status]] += int(count)
+    # Only the current week is ever read; a little over a week back covers every timezone
+    now = datetime.now(timezone.utc)
+    for user_id, timezone_str, completed_at in _recent_completions(db, now - timedelta(days=8), user_ids):
+        field = week_field(completed_at, timezone_str)
+        if field == week_field(now, timezone_str):
+            # The task may have been completed between the two queries
+            counters = stats.setdefault(user_id, {"upcoming": 0, "overdue": 0, "completed": 0})
+            counters[field] = counters.get(field, 0) + 1
+
+    try:
+        with redis_client.pipeline() as pipe:
+            for user_id, counters in stats.items():
+                pipe.delete(_key(user_id))
+                pipe.hset(_key(user_id), mapping=counters)
+                pipe.expire(_key(user_id), USER_STATS_TTL)
+            pipe.execute()
+    except redis.RedisError as e:
+        logging.error(f"Error storing rebuilt stats: {e}")
+    return stats
+
+
+def get_user_stats(db: Session, user_id: int, timezone_str: Optional[str]) -> dict:
+    """Stats for the Mini App; rebuilds the hash from the database on a miss."""
+    try:
+        counters = {field: int(value) for field, value in redis_client.hgetall(_key(user_id)).items()}
+    except redis.RedisError as e:
+        logging.error(f"Error reading stats for user {user_id}: {e}")
+        counters = {}
+    if not counters:
+        counters = rebuild_stats(db, [user_id])[user_id]
+
+    completed = counters.get("completed", 0)
+    overdue = counters.get("overdue", 0)
+    finished = completed + overdue
+    return {
+        "upcoming": counters.get("upcoming", 0),
+        "overdue": overdue,
+        "completed_total": completed,
+        "completed_this_week": counters.get(week_field(datetime.now(timezone.utc), timezone_str), 0),
+        # Share of tasks whose due date has passed that were completed
+        "completion_rate": round(completed / finished, 3) if finished else None,
+    }
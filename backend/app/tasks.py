@@ -1,14 +1,32 @@
-from .celery_app import app
+from .celery_app import app, REDIS_HOST
 import logging
 import httpx
+import redis
 import os
 import json
+import time
 from datetime import datetime, timezone, timedelta
+from collections import Counter
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.orm import joinedload
 from .db import SessionLocal
 from . import models
 from .models import TaskStatus
 from .utils import format_user_time
+from .users import ensure_user
+from .events import publish_task_event
+from .replica import mark_user_write
+from .stats import rebuild_stats, record_transition
+from .recurrence import materialize_next, normalize_rule
 from . import google_calendar
+from .metrics import (
+    InstrumentedRedis,
+    NOTIFICATIONS,
+    REMINDER_LAG,
+    SWEEP_BATCH_SIZE,
+    SWEEP_DURATION,
+    TELEGRAM_API_LATENCY,
+)
 
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 LLM_SERVICE_URL = os.getenv("LLM_SERVICE_URL", "http://llm-service:8000")
@@ -17,6 +35,46 @@ LLM_INTERNAL_API_KEY = os.getenv("LLM_INTERNAL_API_KEY")
 if not LLM_INTERNAL_API_KEY:
     raise RuntimeError("LLM_INTERNAL_API_KEY environment variable is required")
 
+# Outage catch-up policy for overdue reminders
+CATCHUP_GRACE_SECONDS = int(os.getenv("CATCHUP_GRACE_SECONDS", "60"))  # later than this counts as backlog
+CATCHUP_MISSED_AFTER_MINUTES = int(os.getenv("CATCHUP_MISSED_AFTER_MINUTES", "720"))  # older ones are marked missed
+CATCHUP_BATCH_SIZE = int(os.getenv("CATCHUP_BATCH_SIZE", "500"))  # overdue tasks drained per sweep
+CATCHUP_RATE_PER_SECOND = float(os.getenv("CATCHUP_RATE_PER_SECOND", "20"))  # backlog messages per second
+
+# Guards the sweep body so overlapping runs (slow sweep, beat failover) never
+# schedule the same tasks twice. Must outlive the slowest expected sweep.
+SWEEP_LOCK_KEY = "lock:check_due_tasks"
+SWEEP_LOCK_TIMEOUT_SECONDS = int(os.getenv("SWEEP_LOCK_TIMEOUT_SECONDS", "120"))
+
+redis_client = InstrumentedRedis(host=REDIS_HOST, port=6379, decode_responses=True)
+
+# A SCHEDULED task is only backed by a Celery ETA message held in worker memory.
+# The lease records when that message should have fired; once it expires the
+# sweep assumes the message was lost and re-queues the task.
+LEASE_GRACE_SECONDS = int(os.getenv("LEASE_GRACE_SECONDS", "120"))
+RECLAIM_BATCH_SIZE = int(os.getenv("RECLAIM_BATCH_SIZE", "500"))
+
+# Finished tasks older than this move from `tasks` to `tasks_archive`, in
+# batches so no single transaction holds many row locks or bloats WAL.
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "30"))
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "1000"))
+ARCHIVE_MAX_BATCHES = int(os.getenv("ARCHIVE_MAX_BATCHES", "50"))  # per run
+ARCHIVED_STATUSES = (TaskStatus.SENT, TaskStatus.COMPLETED, TaskStatus.MISSED)
+# Upcoming reminders for one chat whose due dates fall in the same window are
+# delivered as one message. The message fires at the latest due date in the
+# group, so nothing is sent early but reminders can be up to the window late;
+# off (0) by default to keep delivery on time.
+NOTIFICATION_COALESCE_SECONDS = int(os.getenv("NOTIFICATION_COALESCE_SECONDS", "0"))
+NOTIFICATION_GROUP_MAX_TASKS = 10  # keeps the per-task keyboard readable
+# With at most NOTIFICATION_GROUP_MAX_TASKS entries this keeps a grouped
+# message under Telegram's 4096-character limit
+GROUP_DESCRIPTION_MAX_CHARS = 300
+STATS_RECONCILE_BATCH_SIZE = int(os.getenv("STATS_RECONCILE_BATCH_SIZE", "1000"))
+ARCHIVE_COLUMNS = (
+    "id", "user_id", "description", "due_date", "created_at", "completed_at", "status",
+    "message_id", "chat_id", "google_calendar_event_id", "sent_at", "delivery_attempts",
+)
+
 @app.task
 def process_llm_request(telegram_id: int, chat_id: int, message_id: int, text: str, timezone_str: str):
     logging.info(f"Processing LLM request for user {telegram_id}")
@@ -51,18 +109,11 @@ def process_llm_request(telegram_id: int, chat_id: int, message_id: int, text: s
             logging.info(f"Task for message {message_id} already exists. Skipping.")
             return
 
-        user = db.query(models.User).filter(models.User.telegram_id == telegram_id).first()
-        if not user:
-            user = models.User(telegram_id=telegram_id, timezone=timezone_str)
-            db.add(user)
-            db.commit()
-            db.refresh(user)
-        elif user.timezone != timezone_str:
-            user.timezone = timezone_str
-            db.commit()
+        user = ensure_user(db, telegram_id, timezone_str)
 
         iso_datetime = task_data["params"]["iso_datetime"]
         description = task_data["params"]["text"]
+        recurrence = normalize_rule(task_data["params"].get("recurrence"))
 
         eta = datetime.fromisoformat(iso_datetime)
         if eta.tzinfo is None:
@@ -87,10 +138,16 @@ def process_llm_request(telegram_id: int, chat_id: int, message_id: int, text: s
             message_id=message_id,
             chat_id=chat_id,
             status=TaskStatus.SCHEDULED if should_schedule_now else TaskStatus.CREATED,
+            lease_expires_at=lease_expiry(max(eta, now)) if should_schedule_now else None,
+            scheduled_at=now if should_schedule_now else None,
+            recurrence=recurrence,
         )
         db.add(new_task)
         db.commit()
         db.refresh(new_task)
+        mark_user_write(telegram_id)
+        publish_task_event(telegram_id, "created", new_task, timezone_str)
+        record_transition(user.id, None, new_task.status)
 
         # Schedule notification in Celery if due soon
         if should_schedule_now:
@@ -104,9 +161,10 @@ def process_llm_request(telegram_id: int, chat_id: int, message_id: int, text: s
 
         # Create Google Calendar event if user has connected calendar
         calendar_status = ""
-        if user.google_calendar_token:
+        if user.calendar_connected:
             try:
-                token_data = json.loads(user.google_calendar_token)
+                token = db.query(models.User.google_calendar_token).filter(models.User.id == user.id).scalar()
+                token_data = json.loads(token)
                 event_id = google_calendar.create_calendar_event(
                     token_data, description, eta, new_task.id
                 )
@@ -118,13 +176,14 @@ def process_llm_request(telegram_id: int, chat_id: int, message_id: int, text: s
                 logging.error(f"Error creating calendar event: {e}")
 
         formatted_time = format_user_time(eta, timezone_str)
+        recurrence_status = "\n🔁 Повторяющееся напоминание" if recurrence else ""
 
         # User requested: "on message with reminder add 3 inline buttons... on message after creation remove cancel button"
         # So here (creation) we remove buttons.
         edit_message(
             chat_id,
             message_id,
-            f"✅ Задача запланирована!\n\n📝 {description}\n⏰ {formatted_time}{calendar_status}"
+            f"✅ Задача запланирована!\n\n📝 {description}\n⏰ {formatted_time}{recurrence_status}{calendar_status}"
         )
         logging.info(f"Task {new_task.id} created for user {telegram_id}")
         
@@ -139,53 +198,260 @@ def check_due_tasks():
     """
     Fetch tasks with due_date in the next 5 minutes and schedule them
     with Celery apply_async to fire at the exact due time.
+
+    Tasks that are already overdue (e.g. after a worker or Redis outage) go
+    through the catch-up policy instead: too-stale ones are marked MISSED,
+    the rest are drained in bounded, rate-limited batches and coalesced into
+    a single digest per chat.
     """
     logging.info("check_due_tasks started")
+    sweep_lock = redis_client.lock(SWEEP_LOCK_KEY, timeout=SWEEP_LOCK_TIMEOUT_SECONDS)
+    if not sweep_lock.acquire(blocking=False):
+        logging.info("check_due_tasks already running elsewhere, skipping")
+        return
+
+    started = time.perf_counter()
     db = SessionLocal()
     try:
         now = datetime.now(timezone.utc)
         window_end = now + timedelta(minutes=5)
+        overdue_before = now - timedelta(seconds=CATCHUP_GRACE_SECONDS)
+        missed_before = now - timedelta(minutes=CATCHUP_MISSED_AFTER_MINUTES)
+
+        # Reminders that are too old to be useful are not delivered at all
+        missed = db.execute(
+            update(models.Task)
+            .where(models.Task.due_date < missed_before, models.Task.status == TaskStatus.CREATED)
+            .values(status=TaskStatus.MISSED)
+            .returning(models.Task.id, models.Task.user_id, models.Task.recurrence)
+        ).all()
+        db.commit()
+        missed_count = len(missed)
+        if missed_count:
+            logging.warning(f"Marked {missed_count} stale tasks as missed")
+            for user_id, count in Counter(row.user_id for row in missed).items():
+                record_transition(user_id, TaskStatus.CREATED, TaskStatus.MISSED, count=count)
+            # A missed occurrence must not end its series
+            recurring_ids = [row.id for row in missed if row.recurrence]
+            if recurring_ids:
+                _materialize_recurring(db, recurring_ids, now)
+        SWEEP_BATCH_SIZE.labels(stage="missed").observe(missed_count)
+
+        SWEEP_BATCH_SIZE.labels(stage="reclaimed").observe(_reclaim_expired_leases(db, now, missed_before))
+        SWEEP_BATCH_SIZE.labels(stage="backlog").observe(_schedule_overdue_backlog(db, overdue_before, now))
 
         # Get tasks that are due within the next 5 minutes and not yet scheduled
         upcoming_tasks = db.query(models.Task).filter(
+            models.Task.due_date >= overdue_before,
             models.Task.due_date <= window_end,
             models.Task.status == TaskStatus.CREATED
         ).all()
 
         logging.info(f"Found {len(upcoming_tasks)} tasks in the next 5 minutes")
-
-        for task in upcoming_tasks:
-            # Calculate delay - how many seconds until due_date
-            delay_seconds = (task.due_date - now).total_seconds()
-            if delay_seconds < 0:
-                delay_seconds = 0
-
-            # Schedule the notification to fire at the exact time
-            send_task_notification.apply_async(
-                args=[task.id],
-                countdown=delay_seconds
-            )
-
-            # Mark task as SCHEDULED so we don't schedule it again
-            task.status = TaskStatus.SCHEDULED
+        SWEEP_BATCH_SIZE.labels(stage="upcoming").observe(len(upcoming_tasks))
+
+        for group in _coalesce_by_chat(upcoming_tasks):
+            # Schedule the notification to fire at the exact time and mark
+            # the tasks as SCHEDULED so we don't schedule them again
+            if len(group) == 1:
+                delay_seconds = schedule_task_notification(group[0], now)
+            else:
+                delay_seconds = schedule_group_notification(group, now)
             db.commit()
-            logging.info(f"Task {task.id} scheduled to fire in {delay_seconds:.0f} seconds")
+            logging.info(f"Tasks {[task.id for task in group]} scheduled to fire in {delay_seconds:.0f} seconds")
     except Exception as e:
         logging.error(f"Error in check_due_tasks: {e}")
     finally:
         db.close()
+        SWEEP_DURATION.observe(time.perf_counter() - started)
+        try:
+            sweep_lock.release()
+        except redis.exceptions.LockError:
+            logging.warning("check_due_tasks lock expired before release")
     logging.info("check_due_tasks finished")
 
 
+def _coalesce_by_chat(tasks: list[models.Task]) -> list[list[models.Task]]:
+    """Split tasks into per-chat groups of reminders due in the same coalescing window."""
+    if NOTIFICATION_COALESCE_SECONDS <= 0:
+        return [[task] for task in tasks]
+
+    groups: dict[tuple, list[models.Task]] = {}
+    for task in sorted(tasks, key=lambda t: t.due_date):
+        window = int(task.due_date.timestamp()) // NOTIFICATION_COALESCE_SECONDS
+        groups.setdefault((task.chat_id or task.user.telegram_id, window), []).append(task)
+    return [
+        group[start:start + NOTIFICATION_GROUP_MAX_TASKS]
+        for group in groups.values()
+        for start in range(0, len(group), NOTIFICATION_GROUP_MAX_TASKS)
+    ]
+
+
+def _materialize_recurring(db, task_ids: list[int], now: datetime) -> None:
+    """Create the next occurrence for each of the given (already finished) recurring tasks."""
+    tasks = db.query(models.Task).options(joinedload(models.Task.user)).filter(models.Task.id.in_(task_ids)).all()
+    created = [(task.user, materialize_next(db, task, task.user.timezone, now)) for task in tasks]
+    db.commit()
+    for user, next_task in created:
+        if next_task:
+            publish_task_event(user.telegram_id, "created", next_task, user.timezone)
+            record_transition(user.id, None, next_task.status)
+
+
+def _schedule_overdue_backlog(db, overdue_before: datetime, now: datetime) -> int:
+    """
+    Drain one batch of overdue CREATED tasks.
+
+    At most CATCHUP_BATCH_SIZE tasks are taken per sweep (oldest first), the
+    remainder is picked up by the next sweep. Deliveries are spread out at
+    CATCHUP_RATE_PER_SECOND messages per second, and chats with several
+    overdue reminders get digest messages of up to NOTIFICATION_GROUP_MAX_TASKS
+    reminders instead of one message each. Returns the number of tasks scheduled.
+    """
+    backlog = db.query(models.Task).options(joinedload(models.Task.user)).filter(
+        models.Task.due_date < overdue_before,
+        models.Task.status == TaskStatus.CREATED
+    ).order_by(models.Task.due_date).limit(CATCHUP_BATCH_SIZE).all()
+
+    if not backlog:
+        return 0
+
+    digests = _split_backlog(backlog)
+    logging.warning(f"Catch-up: draining {len(backlog)} overdue tasks in {len(digests)} messages")
+
+    leases = {}
+    for i, (chat_id, task_ids) in enumerate(digests):
+        countdown = i / CATCHUP_RATE_PER_SECOND
+        if len(task_ids) == 1:
+            send_task_notification.apply_async(args=[task_ids[0]], countdown=countdown)
+        else:
+            send_digest_notification.apply_async(args=[chat_id, task_ids], countdown=countdown)
+        lease = lease_expiry(now + timedelta(seconds=countdown))
+        for task_id in task_ids:
+            leases[task_id] = lease
+
+    for task in backlog:
+        task.status = TaskStatus.SCHEDULED
+        task.lease_expires_at = leases[task.id]
+        task.scheduled_at = now
+    db.commit()
+    return len(backlog)
+
+
+def _split_backlog(backlog: list[models.Task]) -> list[tuple[int, list[int]]]:
+    """(chat_id, task_ids) per message: one chat's tasks in chunks small enough for one Telegram message."""
+    by_chat: dict[int, list[int]] = {}
+    for task in backlog:
+        by_chat.setdefault(task.chat_id or task.user.telegram_id, []).append(task.id)
+    return [
+        (chat_id, task_ids[start:start + NOTIFICATION_GROUP_MAX_TASKS])
+        for chat_id, task_ids in by_chat.items()
+        for start in range(0, len(task_ids), NOTIFICATION_GROUP_MAX_TASKS)
+    ]
+
+
+def _reclaim_expired_leases(db, now: datetime, missed_before: datetime) -> int:
+    """
+    Release SCHEDULED tasks whose ETA message should have fired long ago.
+
+    Only rows in the partial index on lease_expires_at are touched, so the
+    pass stays cheap regardless of table size. Tasks too stale to deliver
+    are marked MISSED; the rest go back to CREATED, so this same sweep's
+    catch-up pass delivers them in rate-limited digests. A late original
+    message still finds them in a sendable state, and send_task_notification
+    locks the row before sending, so they are never delivered twice.
+    Returns the number of tasks reclaimed.
+    """
+    expired_ids = db.execute(
+        select(models.Task.id)
+        .where(models.Task.status == TaskStatus.SCHEDULED, models.Task.lease_expires_at < now)
+        .order_by(models.Task.lease_expires_at)
+        .limit(RECLAIM_BATCH_SIZE)
+        .with_for_update(skip_locked=True)
+    ).scalars().all()
+
+    if not expired_ids:
+        return 0
+
+    missed = db.execute(
+        update(models.Task)
+        .where(models.Task.id.in_(expired_ids), models.Task.due_date < missed_before)
+        .execution_options(synchronize_session="fetch")
+        .values(status=TaskStatus.MISSED, lease_expires_at=None)
+        .returning(models.Task.id, models.Task.user_id, models.Task.recurrence)
+    ).all()
+    db.execute(
+        update(models.Task)
+        .where(models.Task.id.in_(expired_ids), models.Task.status == TaskStatus.SCHEDULED)
+        .execution_options(synchronize_session="fetch")
+        .values(status=TaskStatus.CREATED, lease_expires_at=None)
+    )
+    db.commit()
+
+    for user_id, count in Counter(row.user_id for row in missed).items():
+        record_transition(user_id, TaskStatus.SCHEDULED, TaskStatus.MISSED, count=count)
+    recurring_ids = [row.id for row in missed if row.recurrence]
+    if recurring_ids:
+        _materialize_recurring(db, recurring_ids, now)
+    logging.warning(
+        f"Reclaimed {len(expired_ids)} scheduled tasks with expired leases, {len(missed)} of them marked missed"
+    )
+    return len(expired_ids)
+
+
+def lease_expiry(fire_at: datetime) -> datetime:
+    """Time after which a notification expected at fire_at is considered lost."""
+    return fire_at + timedelta(seconds=LEASE_GRACE_SECONDS)
+
+
+def schedule_task_notification(task: models.Task, now: datetime) -> float:
+    """
+    Queue the notification for a task to fire at its due date and move it to
+    SCHEDULED with a lease. The caller commits. Returns the delay in seconds.
+    """
+    delay_seconds = max((task.due_date - now).total_seconds(), 0)
+    send_task_notification.apply_async(
+        args=[task.id],
+        countdown=delay_seconds
+    )
+    task.status = TaskStatus.SCHEDULED
+    task.lease_expires_at = lease_expiry(now + timedelta(seconds=delay_seconds))
+    task.scheduled_at = now
+    return delay_seconds
+
+
+def schedule_group_notification(tasks: list[models.Task], now: datetime) -> float:
+    """
+    Queue one grouped notification for tasks of the same chat, firing at the
+    latest due date among them, and move them to SCHEDULED with a lease.
+    The caller commits. Returns the delay in seconds.
+    """
+    chat_id = tasks[0].chat_id or tasks[0].user.telegram_id
+    fire_at = max(task.due_date for task in tasks)
+    delay_seconds = max((fire_at - now).total_seconds(), 0)
+    send_grouped_notification.apply_async(
+        args=[chat_id, [task.id for task in tasks]],
+        countdown=delay_seconds
+    )
+    lease = lease_expiry(now + timedelta(seconds=delay_seconds))
+    for task in tasks:
+        task.status = TaskStatus.SCHEDULED
+        task.lease_expires_at = lease
+        task.scheduled_at = now
+    return delay_seconds
+
+
 @app.task
 def send_task_notification(task_id: int):
     """Send notification for a specific task."""
     logging.info(f"send_task_notification started for task {task_id}")
     db = SessionLocal()
     try:
-        task = db.query(models.Task).filter(models.Task.id == task_id).first()
+        # Lock the row for the duration of the send: a reclaimed duplicate of
+        # this message skips it and then finds the task already SENT.
+        task = db.query(models.Task).filter(models.Task.id == task_id).with_for_update(skip_locked=True).first()
         if not task:
-            logging.warning(f"Task {task_id} not found")
+            logging.warning(f"Task {task_id} not found or already being delivered")
             return
 
         if task.status not in (TaskStatus.CREATED, TaskStatus.SCHEDULED):
@@ -194,6 +460,7 @@ def send_task_notification(task_id: int):
 
         time_str = format_user_time(task.due_date, task.user.timezone)
 
+        task.delivery_attempts = (task.delivery_attempts or 0) + 1
         logging.info(f"Sending notification for task {task.id} to user {task.user.telegram_id}")
         ok = send_notification_with_buttons(
             task.chat_id or task.user.telegram_id,
@@ -202,37 +469,228 @@ def send_task_notification(task_id: int):
         )
         if not ok:
             logging.warning(f"Failed to send notification for task {task.id}")
+            NOTIFICATIONS.labels(kind="single", outcome="failed").inc()
             task.status = TaskStatus.CREATED
+            task.lease_expires_at = None
             db.commit()
             return
 
+        old_status = task.status
         task.status = TaskStatus.SENT
+        task.lease_expires_at = None
+        task.sent_at = datetime.now(timezone.utc)
+        next_task = materialize_next(db, task, task.user.timezone, task.sent_at)
         db.commit()
+        publish_task_event(task.user.telegram_id, "sent", task, task.user.timezone)
+        record_transition(task.user_id, old_status, TaskStatus.SENT)
+        if next_task:
+            publish_task_event(task.user.telegram_id, "created", next_task, task.user.timezone)
+            record_transition(task.user_id, None, next_task.status)
+        NOTIFICATIONS.labels(kind="single", outcome="sent").inc()
+        REMINDER_LAG.labels(kind="single").observe((task.sent_at - task.due_date).total_seconds())
         logging.info(f"Task {task.id} marked as sent")
     except Exception as e:
         logging.error(f"Error in send_task_notification for task {task_id}: {e}")
     finally:
         db.close()
 
-def send_notification(chat_id, text):
+@app.task
+def send_digest_notification(chat_id: int, task_ids: list[int]):
+    """Send one message listing several overdue reminders for the same chat."""
+    _send_task_group(chat_id, task_ids, "digest")
+
+@app.task
+def send_grouped_notification(chat_id: int, task_ids: list[int]):
+    """Send one message for several reminders of the same chat that are due together."""
+    _send_task_group(chat_id, task_ids, "grouped")
+
+
+def _send_task_group(chat_id: int, task_ids: list[int], kind: str):
+    """Deliver several tasks as one numbered message with per-task buttons and record the outcome."""
+    logging.info(f"send_{kind}_notification started for chat {chat_id} ({len(task_ids)} tasks)")
+    db = SessionLocal()
+    try:
+        tasks = db.query(models.Task).filter(
+            models.Task.id.in_(task_ids),
+            models.Task.status.in_((TaskStatus.CREATED, TaskStatus.SCHEDULED))
+        ).order_by(models.Task.due_date).with_for_update(skip_locked=True).all()
+        if not tasks:
+            logging.info(f"No pending tasks left for {kind} notification in chat {chat_id}")
+            return
+
+        title = "Пропущенные напоминания" if kind == "digest" else "Напоминания"
+        text = render_task_group(
+            title, [(task.description, format_user_time(task.due_date, task.user.timezone)) for task in tasks]
+        )
+        for task in tasks:
+            task.delivery_attempts = (task.delivery_attempts or 0) + 1
+        # Digests queued before backlogs were split can still be longer than a keyboard allows
+        reply_markup = group_buttons([task.id for task in tasks]) if len(tasks) <= NOTIFICATION_GROUP_MAX_TASKS else None
+        ok = send_notification(chat_id, text, reply_markup)
+
+        sent_at = datetime.now(timezone.utc)
+        new_status = TaskStatus.SENT if ok else TaskStatus.CREATED
+        old_statuses = {task.id: task.status for task in tasks}
+        next_tasks = []
+        for task in tasks:
+            task.status = new_status
+            task.lease_expires_at = None
+            if ok:
+                task.sent_at = sent_at
+                next_task = materialize_next(db, task, task.user.timezone, sent_at)
+                if next_task:
+                    next_tasks.append((task.user, next_task))
+        db.commit()
+        for user, next_task in next_tasks:
+            publish_task_event(user.telegram_id, "created", next_task, user.timezone)
+            record_transition(user.id, None, next_task.status)
+        NOTIFICATIONS.labels(kind=kind, outcome="sent" if ok else "failed").inc()
+        if ok:
+            for task in tasks:
+                REMINDER_LAG.labels(kind=kind).observe((sent_at - task.due_date).total_seconds())
+                publish_task_event(task.user.telegram_id, "sent", task, task.user.timezone)
+                record_transition(task.user_id, old_statuses[task.id], TaskStatus.SENT)
+            logging.info(f"{kind.capitalize()} notification with {len(tasks)} tasks sent to chat {chat_id}")
+        else:
+            logging.warning(f"Failed to send {kind} notification to chat {chat_id}")
+    except Exception as e:
+        logging.error(f"Error in send_{kind}_notification for chat {chat_id}: {e}")
+    finally:
+        db.close()
+
+@app.task
+def archive_finished_tasks():
+    """
+    Move SENT/COMPLETED/MISSED tasks older than ARCHIVE_AFTER_DAYS into tasks_archive.
+
+    Archived tasks can still be updated: update_task restores them first.
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(days=ARCHIVE_AFTER_DAYS)
+    archived = 0
+    db = SessionLocal()
+    try:
+        for _ in range(ARCHIVE_MAX_BATCHES):
+            moved = _archive_batch(db, cutoff)
+            archived += moved
+            if moved < ARCHIVE_BATCH_SIZE:
+                break
+    except Exception as e:
+        db.rollback()
+        logging.error(f"Error archiving finished tasks: {e}")
+    finally:
+        db.close()
+
+    SWEEP_BATCH_SIZE.labels(stage="archived").observe(archived)
+    if archived:
+        logging.info(f"Archived {archived} finished tasks older than {cutoff.isoformat()}")
+    return archived
+
+
+@app.task
+def reconcile_user_stats():
+    """Rebuild every user's stats hash from the database to correct drift in the incremental counters."""
+    db = SessionLocal()
+    try:
+        user_ids = db.execute(select(models.User.id).order_by(models.User.id)).scalars().all()
+        for start in range(0, len(user_ids), STATS_RECONCILE_BATCH_SIZE):
+            rebuild_stats(db, user_ids[start:start + STATS_RECONCILE_BATCH_SIZE])
+        logging.info(f"Reconciled stats for {len(user_ids)} users")
+    except Exception as e:
+        logging.error(f"Error reconciling user stats: {e}")
+    finally:
+        db.close()
+
+
+def _archive_batch(db, cutoff: datetime) -> int:
+    """Move one batch in a single statement: DELETE ... RETURNING feeding INSERT ... SELECT."""
+    # Matches the partial expression index ix_tasks_finished_age; MISSED tasks age by due_date
+    age = func.coalesce(models.Task.completed_at, models.Task.sent_at, models.Task.due_date)
+    batch_ids = (
+        select(models.Task.id)
+        .where(models.Task.status.in_(ARCHIVED_STATUSES), age < cutoff)
+        .order_by(age)
+        .limit(ARCHIVE_BATCH_SIZE)
+        .with_for_update(skip_locked=True)
+    )
+    moved = (
+        delete(models.Task)
+        .where(models.Task.id.in_(batch_ids))
+        .returning(*(getattr(models.Task, column) for column in ARCHIVE_COLUMNS))
+        .cte("moved")
+    )
+    result = db.execute(
+        insert(models.ArchivedTask).from_select(ARCHIVE_COLUMNS, select(moved))
+    )
+    db.commit()
+    return result.rowcount
+
+
+def restore_archived_task(db, task_id: int, telegram_id: int) -> bool:
+    """
+    Move one archived task of this user back into `tasks` so it can be updated
+    again, e.g. from the buttons of an old notification. Commits. Returns
+    whether the task was found.
+    """
+    owner = select(models.User.id).where(models.User.telegram_id == telegram_id).scalar_subquery()
+    row = db.execute(
+        delete(models.ArchivedTask)
+        .where(models.ArchivedTask.id == task_id, models.ArchivedTask.user_id == owner)
+        .returning(*(getattr(models.ArchivedTask, column) for column in ARCHIVE_COLUMNS))
+    ).first()
+    if row is None:
+        return False
+    db.execute(insert(models.Task).values(dict(zip(ARCHIVE_COLUMNS, row))))
+    db.commit()
+    logging.info(f"Restored archived task {task_id}")
+    return True
+
+
+def send_notification(chat_id, text, reply_markup=None) -> bool:
     if BOT_TOKEN is None:
         logging.error("BOT_TOKEN environment variable is not set")
-        return
+        return False
 
     url = f"https://api.telegram.org/bot{BOT_TOKEN}/sendMessage"
     payload = {
         "chat_id": chat_id,
         "text": text
     }
+    if reply_markup:
+        payload["reply_markup"] = reply_markup
     try:
-        with httpx.Client() as client:
+        with httpx.Client() as client, TELEGRAM_API_LATENCY.labels(method="sendMessage").time():
             response = client.post(url, json=payload)
             response.raise_for_status()
             logging.info(f"Successfully sent notification to {chat_id}")
+        return True
     except httpx.HTTPStatusError as e:
         logging.error(f"HTTP error occurred while sending notification: {e}")
+        return False
     except httpx.RequestError as e:
         logging.error(f"Request error occurred while sending notification: {e}")
+        return False
+
+def render_task_group(title: str, items: list[tuple[str, str]]) -> str:
+    """Numbered list of (description, time) pairs, with descriptions cut so the text fits one message."""
+    lines = [f"🔔 {title} ({len(items)}):", ""]
+    for number, (description, time_str) in enumerate(items, start=1):
+        if len(description) > GROUP_DESCRIPTION_MAX_CHARS:
+            description = description[:GROUP_DESCRIPTION_MAX_CHARS - 1] + "…"
+        lines.append(f"{number}. 📝 {description}\n⏰ {time_str}")
+    return "\n".join(lines)
+
+def group_buttons(task_ids: list[int]) -> dict:
+    """One row per task of a grouped message: complete and snooze, labelled by the task's number."""
+    return {
+        "inline_keyboard": [
+            [
+                {"text": f"✅ {number}", "callback_data": f"complete_{task_id}"},
+                {"text": "🔁 5 мин", "callback_data": f"snooze_{task_id}_5"},
+                {"text": "🔁 1 час", "callback_data": f"snooze_{task_id}_60"},
+            ]
+            for number, task_id in enumerate(task_ids, start=1)
+        ]
+    }
 
 def edit_message(chat_id, message_id, text):
     if BOT_TOKEN is None:
@@ -246,7 +704,7 @@ def edit_message(chat_id, message_id, text):
         "text": text
     }
     try:
-        with httpx.Client() as client:
+        with httpx.Client() as client, TELEGRAM_API_LATENCY.labels(method="editMessageText").time():
             response = client.post(url, json=payload)
             response.raise_for_status()
             logging.info(f"Successfully edited message {message_id}")
@@ -278,7 +736,7 @@ def send_notification_with_buttons(chat_id, text, task_id) -> bool:
     }
 
     try:
-        with httpx.Client(timeout=10.0) as client:
+        with httpx.Client(timeout=10.0) as client, TELEGRAM_API_LATENCY.labels(method="sendMessage").time():
             response = client.post(url, json=payload)
             response.raise_for_status()
         logging.info(f"Successfully sent notification with buttons to {chat_id}")
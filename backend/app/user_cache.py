@@ -0,0 +1,115 @@
+"""
+Read-through Redis cache for the per-user fields almost every request needs.
+
+Maps telegram_id -> (user id, timezone, calendar-connected flag). Entries
+expire after USER_CACHE_TTL seconds and are dropped explicitly by every code
+path that writes those fields, via invalidate_user(). Redis failures fall
+back to the database.
+
+The bot keeps its own timezone cache (telegram_bot/main.py); publish_timezone()
+refreshes its Redis key and tells every bot process about the change.
+"""
+
+import json
+import logging
+import os
+from dataclasses import dataclass
+from typing import Optional
+
+import redis
+from sqlalchemy.orm import Session
+
+from . import models
+from .metrics import InstrumentedRedis
+
+REDIS_HOST = os.getenv("REDIS_HOST", "redis")
+USER_CACHE_TTL = int(os.getenv("USER_CACHE_TTL", "3600"))
+# Shared with the bot
+TIMEZONE_REDIS_TTL_SECONDS = 30 * 86400
+TIMEZONE_UPDATES_CHANNEL = "timezone_updates"
+
+redis_client = InstrumentedRedis(host=REDIS_HOST, port=6379, decode_responses=True)
+
+
+@dataclass(frozen=True)
+class CachedUser:
+    id: int
+    telegram_id: int
+    timezone: Optional[str]
+    calendar_connected: bool
+
+
+def _cache_key(telegram_id: int) -> str:
+    return f"user:{telegram_id}"
+
+
+def peek_cached_user(telegram_id: int) -> Optional[CachedUser]:
+    """Return the user's hot fields if they are cached, without touching the database."""
+    try:
+        raw = redis_client.get(_cache_key(telegram_id))
+        if raw:
+            data = json.loads(raw)
+            return CachedUser(
+                id=data["id"],
+                telegram_id=telegram_id,
+                timezone=data["timezone"],
+                calendar_connected=data["calendar"],
+            )
+    except (redis.RedisError, ValueError, KeyError) as e:
+        logging.warning(f"User cache read failed for {telegram_id}: {e}")
+    return None
+
+
+def get_cached_user(db: Session, telegram_id: int) -> Optional[CachedUser]:
+    """Return the user's hot fields, loading them from the DB on a cache miss."""
+    user = peek_cached_user(telegram_id)
+    if user:
+        return user
+
+    row = db.query(
+        models.User.id,
+        models.User.timezone,
+        models.User.google_calendar_token.isnot(None),
+    ).filter(models.User.telegram_id == telegram_id).first()
+    if not row:
+        return None
+
+    user = CachedUser(
+        id=row[0],
+        telegram_id=telegram_id,
+        timezone=row[1],
+        calendar_connected=bool(row[2]),
+    )
+    cache_user(user)
+    return user
+
+
+def cache_user(user: CachedUser) -> None:
+    """Store freshly read or written fields for a user."""
+    try:
+        redis_client.set(
+            _cache_key(user.telegram_id),
+            json.dumps({"id": user.id, "timezone": user.timezone, "calendar": user.calendar_connected}),
+            ex=USER_CACHE_TTL,
+        )
+    except redis.RedisError as e:
+        logging.warning(f"User cache write failed for {user.telegram_id}: {e}")
+
+
+def invalidate_user(telegram_id: int) -> None:
+    """Drop the cached entry; call after committing a change to a cached field."""
+    try:
+        redis_client.delete(_cache_key(telegram_id))
+    except redis.RedisError as e:
+        logging.error(f"User cache invalidation failed for {telegram_id}: {e}")
+
+
+def publish_timezone(telegram_id: int, timezone: str) -> None:
+    """Push a committed timezone to the bot's cache: its Redis key and every process's local copy."""
+    try:
+        with redis_client.pipeline() as pipe:
+            pipe.set(f"timezone:{telegram_id}", timezone, ex=TIMEZONE_REDIS_TTL_SECONDS)
+            pipe.publish(TIMEZONE_UPDATES_CHANNEL, f"{telegram_id}:{timezone}")
+            pipe.execute()
+    except redis.RedisError as e:
+        logging.error(f"Timezone publish failed for {telegram_id}: {e}")
@@ -0,0 +1,64 @@
+"""
+User provisioning.
+
+Every entry point that may see a new Telegram user goes through upsert_user,
+a single INSERT ... ON CONFLICT (telegram_id) DO UPDATE ... RETURNING. It
+needs one round trip and stays race-free when a new user's first messages
+arrive concurrently.
+"""
+
+from typing import Optional
+
+from sqlalchemy import func, literal_column
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from . import models
+from .user_cache import CachedUser, cache_user, peek_cached_user, publish_timezone
+
+
+def upsert_user(db: Session, telegram_id: int, timezone: Optional[str] = None) -> tuple[CachedUser, bool]:
+    """
+    Create the user or update its timezone, and commit.
+
+    A None timezone keeps the stored one. Returns the user's cached fields
+    and whether the row was newly inserted.
+    """
+    stmt = insert(models.User).values(telegram_id=telegram_id, timezone=timezone)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[models.User.telegram_id],
+        set_={"timezone": func.coalesce(stmt.excluded.timezone, models.User.timezone)},
+    ).returning(
+        models.User.id,
+        models.User.timezone,
+        models.User.google_calendar_token.isnot(None),
+        # xmax is 0 only for rows inserted by this statement
+        literal_column("xmax = 0"),
+    )
+    row = db.execute(stmt).one()
+    db.commit()
+
+    user = CachedUser(
+        id=row[0],
+        telegram_id=telegram_id,
+        timezone=row[1],
+        calendar_connected=bool(row[2]),
+    )
+    cache_user(user)
+    if timezone is not None:
+        publish_timezone(telegram_id, user.timezone)
+    return user, bool(row[3])
+
+
+def ensure_user(db: Session, telegram_id: int, timezone: Optional[str] = None) -> CachedUser:
+    """
+    Return the user, provisioning it or updating its timezone if needed.
+
+    The common case (known user, unchanged timezone) is served from the
+    user cache without touching the database; anything else is one upsert.
+    """
+    user = peek_cached_user(telegram_id)
+    if user and (timezone is None or user.timezone == timezone):
+        return user
+    user, _ = upsert_user(db, telegram_id, timezone)
+    return user
@@ -1,4 +1,6 @@
 from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Iterable, Optional
 import logging
 try:
     from zoneinfo import ZoneInfo
@@ -6,25 +8,50 @@ except ImportError:
     # Fallback for older python (though we are on modern)
     from backports.zoneinfo import ZoneInfo
 
-def format_user_time(dt: datetime, timezone_str: str) -> str:
+
+@lru_cache(maxsize=512)
+def get_zone(timezone_str: str) -> Optional[ZoneInfo]:
     """
-    Convert UTC datetime to user's timezone string.
-    Format: dd.mm.yyyy HH:MM
+    Resolve an IANA timezone name, caching the result.
+    Invalid names resolve to None and are logged only on the first lookup.
     """
-    if dt is None:
-        return ""
+    try:
+        return ZoneInfo(timezone_str)
+    except Exception as e:
+        logging.error(f"Timezone conversion error for {timezone_str}: {e}")
+        return None
+
 
-    if dt.tzinfo is None:
-        dt = dt.replace(tzinfo=timezone.utc)
+def _format(dt: datetime) -> str:
+    # Equivalent to strftime("%d.%m.%Y %H:%M") without parsing the format each call
+    return f"{dt.day:02d}.{dt.month:02d}.{dt.year:04d} {dt.hour:02d}:{dt.minute:02d}"
 
+
+def format_user_times(dts: Iterable[Optional[datetime]], timezone_str: Optional[str]) -> list[str]:
+    """
+    Batch version of format_user_time for many datetimes in one timezone.
+    The timezone is resolved once; None entries format as "".
+    """
+    user_tz = get_zone(timezone_str) if timezone_str else None
     if not timezone_str:
         logging.warning("No timezone provided, using UTC")
-        return dt.strftime("%d.%m.%Y %H:%M")
 
-    try:
-        user_tz = ZoneInfo(timezone_str)
-        local_time = dt.astimezone(user_tz)
-        return local_time.strftime("%d.%m.%Y %H:%M")
-    except Exception as e:
-        logging.error(f"Timezone conversion error for {timezone_str}: {e}")
-        return dt.strftime("%d.%m.%Y %H:%M")
+    result = []
+    for dt in dts:
+        if dt is None:
+            result.append("")
+            continue
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=timezone.utc)
+        result.append(_format(dt.astimezone(user_tz) if user_tz else dt))
+    return result
+
+
+def format_user_time(dt: datetime, timezone_str: str) -> str:
+    """
+    Convert UTC datetime to user's timezone string.
+    Format: dd.mm.yyyy HH:MM
+    """
+    if dt is None:
+        return ""
+    return format_user_times((dt,), timezone_str)[0]
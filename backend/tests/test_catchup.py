@@ -0,0 +1,44 @@
+from datetime import datetime, timezone
+
+from conftest import make_task
+
+from app import tasks
+
+
+def test_large_backlog_is_split_into_bounded_digests():
+    backlog = [make_task(task_id, chat_id=1) for task_id in range(495)] + [make_task(1000 + i, chat_id=2) for i in range(5)]
+
+    digests = tasks._split_backlog(backlog)
+
+    assert all(len(task_ids) <= tasks.NOTIFICATION_GROUP_MAX_TASKS for _, task_ids in digests)
+    assert [task_id for _, task_ids in digests for task_id in task_ids] == [task.id for task in backlog]
+    assert len([chat_id for chat_id, _ in digests if chat_id == 1]) == 50
+
+
+def test_full_digest_fits_one_telegram_message():
+    items = [("x" * 5000, "01.01.2026 09:00")] * tasks.NOTIFICATION_GROUP_MAX_TASKS
+
+    text = tasks.render_task_group("Пропущенные напоминания", items)
+
+    assert len(text) <= 4096
+
+
+def _due(task_id, chat_id, second):
+    task = make_task(task_id, chat_id)
+    task.due_date = datetime(2026, 3, 1, 9, 0, second, tzinfo=timezone.utc)
+    return task
+
+
+def test_upcoming_reminders_are_not_coalesced_by_default():
+    upcoming = [_due(1, 1, 0), _due(2, 1, 30)]
+
+    assert tasks._coalesce_by_chat(upcoming) == [[upcoming[0]], [upcoming[1]]]
+
+
+def test_coalescing_groups_one_chats_reminders_in_a_window(monkeypatch):
+    monkeypatch.setattr(tasks, "NOTIFICATION_COALESCE_SECONDS", 60)
+    upcoming = [_due(1, 1, 0), _due(2, 2, 10), _due(3, 1, 30)]
+
+    groups = tasks._coalesce_by_chat(upcoming)
+
+    assert sorted([task.id for task in group] for group in groups) == [[1, 3], [2]]
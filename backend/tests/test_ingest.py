@@ -0,0 +1,46 @@
+import pytest
+from fastapi import HTTPException
+
+from app import idempotency, ingest
+
+
+@pytest.fixture
+def fake_redis(fake_redis, monkeypatch):
+    monkeypatch.setattr(idempotency, "redis_client", fake_redis)
+    return fake_redis
+
+
+@pytest.fixture
+def acked(monkeypatch):
+    entries = []
+    monkeypatch.setattr(ingest, "_ack", entries.append)
+    return entries
+
+
+FIELDS = {"idempotency_key": "k1", "telegram_id": "1", "chat_id": "1", "message_id": "5", "text": "t", "timezone": "UTC"}
+
+
+def test_pending_key_leaves_entry_unacknowledged(fake_redis, acked):
+    # A consumer claimed the key and died before enqueueing
+    idempotency.begin("process-async", "k1", pending_ttl=ingest.INGEST_PENDING_TTL_SECONDS)
+
+    with pytest.raises(HTTPException):
+        ingest.handle_entry("1-0", FIELDS)
+    ingest._process([("1-0", FIELDS)])
+
+    assert acked == []
+
+
+def test_stream_claims_expire_before_reclaim(fake_redis):
+    idempotency.begin("process-async", "k1", pending_ttl=ingest.INGEST_PENDING_TTL_SECONDS)
+
+    assert fake_redis.expiry["idempotency:process-async:k1"] * 1000 < ingest.INGEST_CLAIM_IDLE_MS
+
+
+def test_completed_key_is_acknowledged_without_enqueueing(fake_redis, acked):
+    idempotency.begin("process-async", "k1")
+    idempotency.complete("process-async", "k1", {"message": "ok"})
+
+    ingest.handle_entry("1-0", FIELDS)
+
+    assert acked == ["1-0"]
@@ -0,0 +1,46 @@
+"""Per-endpoint SQL statement budgets, so N+1 regressions fail here."""
+
+import pytest
+
+from app.query_counter import assert_query_budget
+
+# One lookup of the user (the user cache is unavailable in tests) plus one query
+LIST_BUDGET = 2
+AGENDA_BUDGET = 2
+SEARCH_BUDGET = 2
+
+
+def test_task_list_budget(client):
+    response = client.get("/api/tasks", params={"limit": 50})
+
+    assert response.status_code == 200
+    assert len(response.json()) == 50
+    assert_query_budget(response, LIST_BUDGET)
+
+
+def test_task_list_next_page_budget(client):
+    first = client.get("/api/tasks", params={"limit": 20}).json()
+    last = first[-1]
+
+    response = client.get("/api/tasks", params={"limit": 20, "before_due": last["due_date"], "before_id": last["id"]})
+
+    assert response.status_code == 200
+    assert_query_budget(response, LIST_BUDGET)
+
+
+def test_agenda_budget(client):
+    response = client.get("/api/tasks/agenda")
+
+    assert response.status_code == 200
+    assert_query_budget(response, AGENDA_BUDGET)
+
+
+def test_search_budget(client, engine):
+    if engine.dialect.name != "postgresql":
+        pytest.skip("full-text search needs Postgres; set TEST_DATABASE_URL")
+
+    response = client.get("/api/tasks/search", params={"q": "молоко"})
+
+    assert response.status_code == 200
+    assert response.json()
+    assert_query_budget(response, SEARCH_BUDGET)
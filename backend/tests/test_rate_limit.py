@@ -0,0 +1,32 @@
+from starlette.requests import Request
+
+from app import rate_limit
+from app.main import _rate_limit_identity
+
+
+def test_rate_limited_response_is_readable_cross_origin(client, monkeypatch):
+    monkeypatch.setattr(rate_limit, "acquire", lambda *buckets, cost=1: (False, 2.5))
+
+    response = client.get("/api/tasks", headers={"Origin": "http://localhost:5173"})
+
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "3"
+    assert response.headers["access-control-allow-origin"] == "http://localhost:5173"
+
+
+def _identity(headers):
+    scope = {
+        "type": "http",
+        "method": "GET",
+        "path": "/api/tasks",
+        "query_string": b"",
+        "headers": [(name.lower().encode(), value.encode()) for name, value in headers.items()],
+        "client": ("172.18.0.5", 50000),
+    }
+    return _rate_limit_identity(Request(scope))
+
+
+def test_ip_identity_uses_address_forwarded_by_nginx():
+    assert _identity({"X-Real-IP": "203.0.113.7"}) == "ip:203.0.113.7"
+    assert _identity({"X-Forwarded-For": "10.0.0.1, 203.0.113.8"}) == "ip:203.0.113.8"
+    assert _identity({}) == "ip:172.18.0.5"
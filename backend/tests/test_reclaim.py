@@ -0,0 +1,42 @@
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import select
+
+from app import models, tasks
+from app.models import TaskStatus
+from conftest import TELEGRAM_ID
+
+
+def test_expired_leases_go_to_catchup_or_missed(session_factory, monkeypatch):
+    transitions = []
+    monkeypatch.setattr(tasks, "record_transition", lambda *args, **kwargs: transitions.append((args, kwargs)))
+    monkeypatch.setattr(tasks, "_materialize_recurring", lambda db, task_ids, now: None)
+    now = datetime.now(timezone.utc)
+    missed_before = now - timedelta(minutes=tasks.CATCHUP_MISSED_AFTER_MINUTES)
+
+    with session_factory() as db:
+        user_id = db.execute(select(models.User.id).where(models.User.telegram_id == TELEGRAM_ID)).scalar_one()
+
+        def scheduled(due_date, lease_expires_at):
+            task = models.Task(
+                user_id=user_id, description="lease", due_date=due_date,
+                status=TaskStatus.SCHEDULED, lease_expires_at=lease_expires_at,
+            )
+            db.add(task)
+            return task
+
+        stale = scheduled(now - timedelta(days=1), now - timedelta(hours=23))
+        recent = scheduled(now - timedelta(minutes=10), now - timedelta(minutes=5))
+        live = scheduled(now + timedelta(minutes=2), now + timedelta(minutes=4))
+        db.commit()
+        ids = {"stale": stale.id, "recent": recent.id, "live": live.id}
+
+        assert tasks._reclaim_expired_leases(db, now, missed_before) == 2
+
+    with session_factory() as db:
+        statuses = {name: db.get(models.Task, task_id) for name, task_id in ids.items()}
+        assert statuses["stale"].status == TaskStatus.MISSED
+        assert statuses["recent"].status == TaskStatus.CREATED
+        assert statuses["recent"].lease_expires_at is None
+        assert statuses["live"].status == TaskStatus.SCHEDULED
+    assert transitions == [((user_id, TaskStatus.SCHEDULED, TaskStatus.MISSED), {"count": 1})]
@@ -0,0 +1,102 @@
+import os
+from datetime import datetime, timedelta, timezone
+
+from conftest import make_task
+
+from app import recurrence
+
+
+class FakeSession:
+    def __init__(self):
+        self.added = []
+
+    def add(self, obj):
+        self.added.append(obj)
+
+
+def _series(rule, due_date, timezone_str="Europe/Berlin", limit=20):
+    """Due dates of every occurrence, completing each one on time."""
+    db = FakeSession()
+    task = make_task(due_date=due_date, recurrence=rule)
+    due_dates = [task.due_date]
+    while task is not None and len(due_dates) < limit:
+        task = recurrence.materialize_next(db, task, timezone_str, task.due_date)
+        if task is not None:
+            due_dates.append(task.due_date)
+    return due_dates
+
+
+def test_count_limited_series_stops():
+    start = datetime(2026, 3, 1, 8, 0, tzinfo=timezone.utc)
+
+    due_dates = _series("FREQ=DAILY;COUNT=3", start)
+
+    assert due_dates == [start, start + timedelta(days=1), start + timedelta(days=2)]
+
+
+def test_count_includes_occurrences_skipped_as_past():
+    start = datetime(2026, 3, 1, 8, 0, tzinfo=timezone.utc)
+    db = FakeSession()
+
+    # Completed only on the third day: two occurrences of five were missed
+    next_task = recurrence.materialize_next(
+        db, make_task(due_date=start, recurrence="FREQ=DAILY;COUNT=5"), "UTC", start + timedelta(days=2, hours=1)
+    )
+
+    assert next_task.due_date == start + timedelta(days=3)
+    assert next_task.recurrence == "FREQ=DAILY;COUNT=2"
+
+
+def test_count_of_one_ends_the_series():
+    start = datetime(2026, 3, 1, 8, 0, tzinfo=timezone.utc)
+
+    task = make_task(due_date=start, recurrence="FREQ=DAILY;COUNT=1")
+
+    assert recurrence.materialize_next(FakeSession(), task, "UTC", start) is None
+
+
+def test_utc_until_is_accepted_and_ends_the_series():
+    assert recurrence.normalize_rule("FREQ=DAILY;UNTIL=20260305T000000Z") == "FREQ=DAILY;UNTIL=20260305T000000Z"
+
+    due_dates = _series("FREQ=DAILY;UNTIL=20260305T000000Z", datetime(2026, 3, 1, 8, 0, tzinfo=timezone.utc))
+
+    assert [d.day for d in due_dates] == [1, 2, 3, 4]
+
+
+def test_naive_until_is_accepted_and_ends_the_series():
+    assert recurrence.normalize_rule("RRULE:FREQ=DAILY;UNTIL=20260304T235959") == "FREQ=DAILY;UNTIL=20260304T235959"
+
+    due_dates = _series("FREQ=DAILY;UNTIL=20260304T235959", datetime(2026, 3, 1, 8, 0, tzinfo=timezone.utc))
+
+    assert [d.day for d in due_dates] == [1, 2, 3, 4]
+
+
+def test_daily_reminder_keeps_local_time_across_dst():
+    # 9:00 in Berlin is 08:00 UTC before the spring change and 07:00 UTC after it
+    due_dates = _series("FREQ=DAILY;COUNT=3", datetime(2026, 3, 28, 8, 0, tzinfo=timezone.utc))
+
+    assert [d.hour for d in due_dates] == [8, 7, 7]
+
+
+def test_invalid_rules_are_rejected():
+    assert recurrence.normalize_rule("FREQ=SOMETIMES") is None
+    assert recurrence.normalize_rule("FREQ=DAILY;COUNT=x") is None
+    assert recurrence.normalize_rule("FREQ=DAILY;UNTIL=soon") is None
+
+
+def test_schedule_rejects_invalid_rule(client):
+    response = client.post(
+        "/schedule",
+        headers={"Authorization": f"Bearer {os.environ['INTERNAL_API_KEY']}"},
+        json={
+            "telegram_id": 1001,
+            "chat_id": 1001,
+            "message_id": 1,
+            "text": "выпить таблетку",
+            "iso_datetime": "2026-10-19T09:00:00+00:00",
+            "timezone": "Europe/Berlin",
+            "recurrence": "FREQ=SOMETIMES",
+        },
+    )
+
+    assert response.status_code == 400
@@ -0,0 +1,20 @@
+from app import replica
+
+
+def test_write_pins_user_even_without_local_replica(fake_redis, monkeypatch):
+    monkeypatch.setattr(replica, "redis_client", fake_redis)
+    monkeypatch.setattr(replica, "ReplicaSessionLocal", None)
+
+    replica.mark_user_write(42)
+
+    assert fake_redis.values["read_primary:42"] == "1"
+    assert fake_redis.expiry["read_primary:42"] == replica.READ_YOUR_WRITES_SECONDS
+
+
+def test_pinned_user_reads_from_primary(fake_redis, monkeypatch):
+    monkeypatch.setattr(replica, "redis_client", fake_redis)
+    monkeypatch.setattr(replica, "ReplicaSessionLocal", object())
+
+    assert replica.read_session_factory(42) is replica.ReplicaSessionLocal
+    replica.mark_user_write(42)
+    assert replica.read_session_factory(42) is replica.SessionLocal
@@ -0,0 +1,24 @@
+from datetime import datetime, timezone
+
+import redis
+
+from app import stats
+
+
+class FailingRedis:
+    def pipeline(self):
+        raise redis.ConnectionError("redis is down")
+
+
+def test_rebuild_counts_completion_without_status_row(monkeypatch):
+    monkeypatch.setattr(stats, "redis_client", FailingRedis())
+    monkeypatch.setattr(stats, "_status_counts", lambda db, user_ids: [])
+    monkeypatch.setattr(
+        stats, "_recent_completions",
+        lambda db, since, user_ids: [(7, "Europe/Berlin", datetime.now(timezone.utc))],
+    )
+
+    rebuilt = stats.rebuild_stats(None)
+
+    week = stats.week_field(datetime.now(timezone.utc), "Europe/Berlin")
+    assert rebuilt[7] == {"upcoming": 0, "overdue": 0, "completed": 0, week: 1}
@@ -0,0 +1,72 @@
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import select
+
+from app import main, models
+from app.models import TaskStatus
+from conftest import TELEGRAM_ID
+
+
+def test_update_task_leaves_session_settings_alone(client, session_factory):
+    with session_factory() as db:
+        user_id = db.execute(select(models.User.id).where(models.User.telegram_id == TELEGRAM_ID)).scalar_one()
+        task = models.Task(
+            user_id=user_id,
+            description="позвонить маме",
+            due_date=datetime.now(timezone.utc) - timedelta(minutes=5),
+            status=TaskStatus.SENT,
+        )
+        db.add(task)
+        db.commit()
+        task_id = task.id
+
+    sessions = []
+
+    def write_db():
+        with session_factory() as db:
+            sessions.append(db)
+            yield db
+
+    main.app.dependency_overrides[main.get_db] = write_db
+    response = client.patch(f"/api/tasks/{task_id}", json={"status": "completed", "description": "позвонить папе"})
+
+    assert response.status_code == 200
+    assert response.json()["task"]["description"] == "позвонить папе"
+    assert response.json()["task"]["status"] == "completed"
+    assert sessions and sessions[0].expire_on_commit
+
+
+def test_archived_task_can_still_be_completed(client, session_factory):
+    with session_factory() as db:
+        user_id = db.execute(select(models.User.id).where(models.User.telegram_id == TELEGRAM_ID)).scalar_one()
+        db.add(models.ArchivedTask(
+            id=20000,
+            user_id=user_id,
+            description="старое напоминание",
+            due_date=datetime.now(timezone.utc) - timedelta(days=40),
+            status=TaskStatus.SENT,
+        ))
+        db.commit()
+
+    response = client.patch("/api/tasks/20000", json={"status": "completed"})
+
+    assert response.status_code == 200
+    assert response.json()["task"]["status"] == "completed"
+    with session_factory() as db:
+        assert db.get(models.ArchivedTask, 20000) is None
+        assert db.get(models.Task, 20000).status == TaskStatus.COMPLETED
+
+
+def test_other_users_archived_task_is_not_restored(client, session_factory):
+    with session_factory() as db:
+        stranger = models.User(telegram_id=TELEGRAM_ID + 1)
+        db.add(stranger)
+        db.flush()
+        db.add(models.ArchivedTask(id=20001, user_id=stranger.id, description="чужое", status=TaskStatus.SENT))
+        db.commit()
+
+    response = client.patch("/api/tasks/20001", json={"status": "completed"})
+
+    assert response.status_code == 404
+    with session_factory() as db:
+        assert db.get(models.ArchivedTask, 20001) is not None
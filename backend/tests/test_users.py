@@ -0,0 +1,32 @@
+from unittest.mock import MagicMock
+
+from app import users
+from app.user_cache import CachedUser
+
+
+def _db_returning(row):
+    db = MagicMock()
+    db.execute.return_value.one.return_value = row
+    return db
+
+
+def test_ensure_user_cache_miss_is_a_single_upsert(monkeypatch):
+    monkeypatch.setattr(users, "peek_cached_user", lambda telegram_id: None)
+    monkeypatch.setattr(users, "cache_user", lambda user: None)
+    monkeypatch.setattr(users, "publish_timezone", lambda telegram_id, timezone: None)
+    db = _db_returning((7, "Europe/Moscow", False, True))
+
+    user = users.ensure_user(db, 42, "Europe/Moscow")
+
+    assert user == CachedUser(id=7, telegram_id=42, timezone="Europe/Moscow", calendar_connected=False)
+    assert db.execute.call_count == 1
+    db.query.assert_not_called()
+
+
+def test_ensure_user_cache_hit_skips_the_database(monkeypatch):
+    cached = CachedUser(id=7, telegram_id=42, timezone="Europe/Moscow", calendar_connected=False)
+    monkeypatch.setattr(users, "peek_cached_user", lambda telegram_id: cached)
+    db = MagicMock()
+
+    assert users.ensure_user(db, 42, "Europe/Moscow") is cached
+    db.execute.assert_not_called()
@@ -0,0 +1,12 @@
+#!/bin/bash
+set -e
+
+# prometheus_client opens its multiprocess files when app.metrics is imported,
+# which Celery does before any worker signal fires, so the directory must exist
+# (and be free of a previous run's files) before the process starts.
+if [ -n "$PROMETHEUS_MULTIPROC_DIR" ]; then
+  rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+  mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+fi
+
+exec "$@"
@@ -35,4 +35,4 @@ done
 
 echo ""
 echo "✅ Все образы успешно собраны и загружены в Docker Hub!"
-echo "Образы для celery-worker и celery-beat не собираются отдельно, так как они используют образ 'backend'."
+echo "Образы для celery-worker-*, celery-beat и llm-ingest не собираются отдельно, так как они используют образ 'backend'."
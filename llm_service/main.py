@@ -41,6 +41,7 @@ class ProcessRequest(BaseModel):
 class TaskParams(BaseModel):
     iso_datetime: str
     text: str
+    recurrence: Optional[str] = None
 
 
 class TaskResponse(BaseModel):
@@ -65,9 +66,14 @@ Your goal is to extract the user's intent, the desired time for the notification
     - "напомни позвонить маме" -> "Позвони маме"
     - "напомни мне выключить суп через час" -> "Выключи суп"
     - "купить молоко" -> "Купи молоко"
-6.  **Unclear Requests:** If the request is ambiguous, not a scheduling request, or lacks a clear action, you must return an error.
-7.  **Output Format:**
-    - On success, return a JSON object: `{"iso_datetime": "...", "text": "..."}`
+6.  **Recurring Reminders:** If the user asks for a repeating reminder ("каждый день", "каждый понедельник", "по будням", "каждое 1 число"), set `iso_datetime` to the FIRST occurrence and add a `recurrence` field with an RFC 5545 RRULE (without the "RRULE:" prefix). Use only FREQ (DAILY, WEEKLY, MONTHLY, YEARLY), INTERVAL, BYDAY (MO,TU,WE,TH,FR,SA,SU), BYMONTHDAY, COUNT and UNTIL. Omit `recurrence` for one-time reminders.
+    - "каждый день в 9" -> `"recurrence": "FREQ=DAILY"`
+    - "каждый понедельник" -> `"recurrence": "FREQ=WEEKLY;BYDAY=MO"`
+    - "по будням" -> `"recurrence": "FREQ=WEEKLY;BYDAY=MO,TU,WE,TH,FR"`
+    - "раз в две недели" -> `"recurrence": "FREQ=WEEKLY;INTERVAL=2"`
+7.  **Unclear Requests:** If the request is ambiguous, not a scheduling request, or lacks a clear action, you must return an error.
+8.  **Output Format:**
+    - On success, return a JSON object: `{"iso_datetime": "...", "text": "..."}`, plus `"recurrence": "..."` for recurring reminders
     - On failure (unclear request, past time, etc.), return: `{"error": "unknown_request"}`
 
 **Examples:**
@@ -77,6 +83,9 @@ Your goal is to extract the user's intent, the desired time for the notification
 - User: "напомни через 2.5 часа проверить почту" (Current: 2025-12-17T12:00:00)
 - Response: `{"iso_datetime": "2025-12-17T14:30:00", "text": "Проверь почту"}`
 
+- User: "каждый понедельник в 10 утра планёрка" (Timezone: Europe/Moscow, Current: 2025-12-17T12:00:00, a Wednesday)
+- Response: `{"iso_datetime": "2025-12-22T07:00:00", "text": "Планёрка", "recurrence": "FREQ=WEEKLY;BYDAY=MO"}`
+
 - User: "позвонить в сервис" (Current: 2025-12-17T10:00:00)
 - Response: `{"iso_datetime": "2025-12-17T10:05:00", "text": "Позвони в сервис"}`
 
@@ -125,7 +134,8 @@ async def process_text(
         if "iso_datetime" in data and "text" in data:
             task_params = TaskParams(
                 iso_datetime=data["iso_datetime"],
-                text=data["text"]
+                text=data["text"],
+                recurrence=data.get("recurrence") or None,
             )
             return TaskResponse(task="notify", params=task_params)
 
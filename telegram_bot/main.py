@@ -1,19 +1,24 @@
 import asyncio
 import logging
 import sys
+import time
 import httpx
 import os
 import uuid
+from collections import OrderedDict
 from datetime import datetime, timedelta, timezone
 from zoneinfo import ZoneInfo
 import io
+from typing import Any, Awaitable, Callable, NamedTuple
 from dotenv import load_dotenv
 from groq import Groq
 
-from aiogram import Bot, Dispatcher, types, F
+from aiogram import BaseMiddleware, Bot, Dispatcher, types, F
 from aiogram.filters import CommandStart, Command
-from aiogram.types import Message, CallbackQuery, MenuButtonWebApp, WebAppInfo, InlineKeyboardMarkup, InlineKeyboardButton
+from aiogram.types import Message, CallbackQuery, TelegramObject, MenuButtonWebApp, WebAppInfo, InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.utils.keyboard import ReplyKeyboardBuilder
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
 
 import redis.asyncio as redis
 from timezonefinder import TimezoneFinder
@@ -28,19 +33,181 @@ WEBAPP_URL = os.getenv("WEBAPP_URL", "https://bot.dzen.today")
 INTERNAL_API_KEY = os.getenv("INTERNAL_API_KEY")
 VOICE_RATE_LIMIT_SECONDS = 60
 ADMIN_IDS = [143743387] # vsevolodg
+# Incoming updates per user (burst, then refill rate) and across the whole bot
+RATE_LIMIT_USER_CAPACITY = int(os.getenv("RATE_LIMIT_USER_CAPACITY", "10"))
+RATE_LIMIT_USER_PER_SECOND = float(os.getenv("RATE_LIMIT_USER_PER_SECOND", "0.5"))
+RATE_LIMIT_GLOBAL_CAPACITY = int(os.getenv("RATE_LIMIT_GLOBAL_CAPACITY", "100"))
+RATE_LIMIT_GLOBAL_PER_SECOND = float(os.getenv("RATE_LIMIT_GLOBAL_PER_SECOND", "30"))
+# "stream": LLM requests go straight onto the Redis stream read by the backend's
+# ingest consumer (backend/app/ingest.py); "http": POST /api/process-async.
+INGEST_MODE = os.getenv("INGEST_MODE", "stream")
+LLM_REQUESTS_STREAM = "llm_requests"
+INGEST_BUSY_THRESHOLD = int(os.getenv("INGEST_BUSY_THRESHOLD", "500"))  # unprocessed stream entries
+INGEST_STREAM_MAXLEN = 100000
+# Timezones: an in-process LRU in front of per-user Redis keys. The backend
+# publishes every change on TIMEZONE_UPDATES_CHANNEL (backend/app/user_cache.py);
+# the local TTL only bounds staleness if a message is lost.
+TIMEZONE_CACHE_SIZE = int(os.getenv("TIMEZONE_CACHE_SIZE", "10000"))
+TIMEZONE_LOCAL_TTL_SECONDS = 3600
+TIMEZONE_REDIS_TTL_SECONDS = 30 * 86400  # refreshed on every read; keep in sync with the backend
+TIMEZONE_UPDATES_CHANNEL = "timezone_updates"
+
+# "polling" for local development; "webhook" lets several stateless replicas
+# sit behind nginx, which proxies WEBHOOK_PATH to them.
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+WEBHOOK_PATH = "/telegram/webhook"
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", f"{PUBLIC_DOMAIN}{WEBHOOK_PATH}")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8081"))
 
 # Validate required environment variables at startup
 if not INTERNAL_API_KEY:
     raise RuntimeError("INTERNAL_API_KEY environment variable is required")
+if BOT_MODE == "webhook" and not WEBHOOK_SECRET:
+    raise RuntimeError("WEBHOOK_SECRET environment variable is required in webhook mode")
 
-def get_backend_headers() -> dict:
+def get_backend_headers(idempotency_key: str | None = None) -> dict:
     """Get headers for internal API calls."""
-    return {"Authorization": f"Bearer {INTERNAL_API_KEY}"}
+    headers = {"Authorization": f"Bearer {INTERNAL_API_KEY}"}
+    if idempotency_key:
+        # Lets the backend drop retried requests instead of processing them twice
+        headers["Idempotency-Key"] = idempotency_key
+    return headers
 
 redis_client = redis.Redis(host=REDIS_HOST, port=6379, decode_responses=True)
 tf = TimezoneFinder()
 
+# Same token-bucket script as backend/app/rate_limit.py; keep the two in sync.
+# KEYS: bucket keys. ARGV: cost, then capacity and refill-per-second for each key.
+TOKEN_BUCKET_SCRIPT = """
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local cost = tonumber(ARGV[1])
+local levels = {}
+local retry_after = 0
+
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[i * 2])
+    local rate = tonumber(ARGV[i * 2 + 1])
+    local state = redis.call('HMGET', key, 'tokens', 'ts')
+    local tokens = tonumber(state[1]) or capacity
+    local ts = tonumber(state[2]) or now
+    tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+    levels[i] = tokens
+    if tokens < cost then
+        retry_after = math.max(retry_after, (cost - tokens) / rate)
+    end
+end
+
+if retry_after > 0 then
+    return {0, tostring(retry_after)}
+end
+
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[i * 2])
+    local rate = tonumber(ARGV[i * 2 + 1])
+    redis.call('HSET', key, 'tokens', tostring(levels[i] - cost), 'ts', tostring(now))
+    redis.call('EXPIRE', key, math.ceil(capacity / rate) + 1)
+end
+return {1, '0'}
+"""
+token_bucket = redis_client.register_script(TOKEN_BUCKET_SCRIPT)
+
+
+class Bucket(NamedTuple):
+    key: str
+    capacity: int
+    per_second: float
+
+
+async def acquire_tokens(*buckets: Bucket) -> tuple[bool, float]:
+    """Take one token from every bucket atomically. Returns (allowed, retry_after_seconds)."""
+    args = [1]
+    for bucket in buckets:
+        args.extend((bucket.capacity, bucket.per_second))
+    try:
+        allowed, retry_after = await token_bucket(keys=[b.key for b in buckets], args=args)
+    except redis.RedisError as e:
+        logging.error(f"Rate limiter unavailable, allowing update: {e}")
+        return True, 0.0
+    return bool(allowed), float(retry_after)
+
+
+class RateLimitMiddleware(BaseMiddleware):
+    """Drops updates once the user's or the bot-wide bucket is empty."""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        user = data.get("event_from_user")
+        if user is None or user.id in ADMIN_IDS:
+            return await handler(event, data)
+
+        allowed, retry_after = await acquire_tokens(
+            Bucket("ratelimit:bot:global", RATE_LIMIT_GLOBAL_CAPACITY, RATE_LIMIT_GLOBAL_PER_SECOND),
+            Bucket(f"ratelimit:bot:{user.id}", RATE_LIMIT_USER_CAPACITY, RATE_LIMIT_USER_PER_SECOND),
+        )
+        if allowed:
+            return await handler(event, data)
+
+        logging.info(f"Rate limited update from user {user.id}, retry in {retry_after:.1f}s")
+        if isinstance(event, CallbackQuery):
+            await event.answer("⏳ Слишком много запросов, подождите немного.")
+        elif isinstance(event, Message):
+            # Warn once per window instead of answering every dropped message
+            if await redis_client.set(f"ratelimit:bot:warned:{user.id}", "1", nx=True, ex=max(1, int(retry_after))):
+                await event.answer("⏳ Слишком много сообщений. Подождите немного и попробуйте снова.")
+        return None
+
+
+async def submit_llm_request(payload: dict, idempotency_key: str) -> str | None:
+    """
+    Hand an LLM request to the backend. Returns an error text for the user, or None on success.
+
+    In stream mode the HTTP endpoint is only used when Redis is unavailable.
+    """
+    if INGEST_MODE == "stream":
+        try:
+            if await redis_client.xlen(LLM_REQUESTS_STREAM) >= INGEST_BUSY_THRESHOLD:
+                return backend_error_text(503)
+            fields = {key: str(value) for key, value in payload.items()}
+            fields["idempotency_key"] = idempotency_key
+            await redis_client.xadd(LLM_REQUESTS_STREAM, fields, maxlen=INGEST_STREAM_MAXLEN, approximate=True)
+            return None
+        except redis.RedisError as e:
+            logging.error(f"Stream ingestion failed, falling back to HTTP: {e}")
+
+    async with httpx.AsyncClient(timeout=10.0) as client:
+        try:
+            response = await client.post(
+                f"{BACKEND_URL}/api/process-async",
+                json=payload,
+                headers=get_backend_headers(idempotency_key)
+            )
+            response.raise_for_status()
+            return None
+        except httpx.HTTPStatusError as e:
+            logging.error(f"HTTP error: {e}")
+            return backend_error_text(e.response.status_code)
+        except httpx.RequestError as e:
+            logging.error(f"Request error: {e}")
+            return "❌ Не удалось подключиться к серверу."
+
+
+def backend_error_text(status_code: int) -> str:
+    """User-facing text for a failed /api/process-async call."""
+    if status_code == 503:
+        return "⏳ Сейчас много запросов, попробуйте через минуту."
+    if status_code == 429:
+        return "⏳ Слишком много запросов. Подождите немного и попробуйте снова."
+    return "❌ Ошибка при обработке запроса."
+
 dp = Dispatcher()
+dp.message.outer_middleware(RateLimitMiddleware())
+dp.callback_query.outer_middleware(RateLimitMiddleware())
 
 def get_location_keyboard():
     builder = ReplyKeyboardBuilder()
@@ -55,30 +222,106 @@ def is_valid_timezone(tz_str: str) -> bool:
     except Exception:
         return False
 
+class TimezoneCache:
+    """Bounded LRU of user_id -> timezone with a per-entry expiry."""
+
+    def __init__(self, size: int, ttl: float):
+        self.size = size
+        self.ttl = ttl
+        self._entries: OrderedDict[int, tuple[str, float]] = OrderedDict()
+
+    def get(self, user_id: int) -> str | None:
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return None
+        timezone_str, expires_at = entry
+        if expires_at < time.monotonic():
+            del self._entries[user_id]
+            return None
+        self._entries.move_to_end(user_id)
+        return timezone_str
+
+    def set(self, user_id: int, timezone_str: str) -> None:
+        self._entries[user_id] = (timezone_str, time.monotonic() + self.ttl)
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+timezone_cache = TimezoneCache(TIMEZONE_CACHE_SIZE, TIMEZONE_LOCAL_TTL_SECONDS)
+
+async def remember_timezone(user_id: int, timezone_str: str) -> None:
+    """Cache a timezone in this process and in Redis."""
+    timezone_cache.set(user_id, timezone_str)
+    try:
+        await redis_client.set(f"timezone:{user_id}", timezone_str, ex=TIMEZONE_REDIS_TTL_SECONDS)
+    except redis.RedisError as e:
+        logging.error(f"Error caching timezone for {user_id}: {e}")
+
 async def get_user_timezone(user_id: int) -> str | None:
-    """Get user timezone from Redis, fallback to database if not cached."""
-    # Try Redis first
-    user_timezone = await redis_client.get(f"timezone:{user_id}")
+    """Get user timezone from the local cache, then Redis, then the backend."""
+    user_timezone = timezone_cache.get(user_id)
+    if user_timezone:
+        return user_timezone
+
+    try:
+        # Sliding expiry: keys of inactive users age out of Redis
+        user_timezone = await redis_client.getex(f"timezone:{user_id}", ex=TIMEZONE_REDIS_TTL_SECONDS)
+    except redis.RedisError as e:
+        logging.error(f"Error reading cached timezone for {user_id}: {e}")
+    if user_timezone:
+        timezone_cache.set(user_id, user_timezone)
+        return user_timezone
 
     # Fallback to database if not in Redis
-    if not user_timezone:
+    try:
+        async with httpx.AsyncClient(timeout=5.0) as client:
+            response = await client.get(
+                f"{BACKEND_URL}/api/users/me",
+                params={"telegram_id": user_id},
+                headers=get_backend_headers()
+            )
+            if response.status_code == 200:
+                user_data = response.json()
+                if user_data.get("timezone"):
+                    user_timezone = user_data["timezone"]
+                    await remember_timezone(user_id, user_timezone)
+    except Exception as e:
+        logging.error(f"Error fetching user timezone from backend: {e}")
+
+    return user_timezone
+
+async def listen_timezone_updates() -> None:
+    """Apply timezone changes published by the backend to the local cache."""
+    while True:
+        pubsub = redis_client.pubsub()
         try:
-            async with httpx.AsyncClient(timeout=5.0) as client:
-                response = await client.get(
-                    f"{BACKEND_URL}/api/users/me",
-                    params={"telegram_id": user_id},
-                    headers=get_backend_headers()
-                )
-                if response.status_code == 200:
-                    user_data = response.json()
-                    if user_data.get("timezone"):
-                        user_timezone = user_data["timezone"]
-                        # Cache it in Redis for next time
-                        await redis_client.set(f"timezone:{user_id}", user_timezone)
+            await pubsub.subscribe(TIMEZONE_UPDATES_CHANNEL)
+            # Changes published while we were not subscribed are lost
+            timezone_cache.clear()
+            async for message in pubsub.listen():
+                if message["type"] != "message":
+                    continue
+                user_id, _, timezone_str = message["data"].partition(":")
+                timezone_cache.set(int(user_id), timezone_str)
+        except asyncio.CancelledError:
+            raise
         except Exception as e:
-            logging.error(f"Error fetching user timezone from backend: {e}")
+            logging.error(f"Timezone update listener failed, resubscribing: {e}")
+            await asyncio.sleep(1)
+        finally:
+            await pubsub.aclose()
 
-    return user_timezone
+async def start_timezone_listener(dispatcher: Dispatcher) -> None:
+    dispatcher["timezone_listener"] = asyncio.create_task(listen_timezone_updates())
+
+async def stop_timezone_listener(dispatcher: Dispatcher) -> None:
+    dispatcher["timezone_listener"].cancel()
+
+dp.startup.register(start_timezone_listener)
+dp.shutdown.register(stop_timezone_listener)
 
 @dp.message(CommandStart())
 async def command_start_handler(message: Message) -> None:
@@ -139,7 +382,7 @@ async def command_timezone_handler(message: Message) -> None:
         )
         return
 
-    await redis_client.set(f"timezone:{user_id}", timezone_str)
+    await remember_timezone(user_id, timezone_str)
 
     # Persist timezone in backend DB
     async with httpx.AsyncClient(timeout=10.0) as client:
@@ -245,7 +488,7 @@ async def handle_location(message: Message):
     timezone_str = tf.timezone_at(lng=lon, lat=lat)
 
     if timezone_str:
-        await redis_client.set(f"timezone:{user_id}", timezone_str)
+        await remember_timezone(user_id, timezone_str)
 
         # Persist timezone in backend DB
         async with httpx.AsyncClient(timeout=10.0) as client:
@@ -296,20 +539,19 @@ async def process_message(message: Message) -> None:
         "timezone": user_timezone,
     }
 
-    async with httpx.AsyncClient(timeout=10.0) as client:
-        try:
-            response = await client.post(
-                f"{BACKEND_URL}/api/process-async",
-                json=payload,
-                headers=get_backend_headers()
-            )
-            response.raise_for_status()
-        except httpx.HTTPStatusError as e:
-            logging.error(f"HTTP error: {e}")
-            await processing_msg.edit_text("❌ Ошибка при обработке запроса.")
-        except httpx.RequestError as e:
-            logging.error(f"Request error: {e}")
-            await processing_msg.edit_text("❌ Не удалось подключиться к серверу.")
+    error_text = await submit_llm_request(payload, f"{chat_id}:{processing_msg.message_id}")
+    if error_text:
+        await processing_msg.edit_text(error_text)
+
+async def remove_task_buttons(message: Message, task_id: str) -> None:
+    """Drop one task's buttons; a grouped notification keeps the rows of its other tasks."""
+    rows = []
+    if message.reply_markup:
+        rows = [
+            row for row in message.reply_markup.inline_keyboard
+            if not any(button.callback_data and button.callback_data.split("_")[1] == task_id for button in row)
+        ]
+    await message.edit_reply_markup(reply_markup=InlineKeyboardMarkup(inline_keyboard=rows) if rows else None)
 
 @dp.callback_query(F.data.startswith("cancel_"))
 async def handle_cancel_callback(callback: CallbackQuery):
@@ -363,7 +605,7 @@ async def handle_snooze_callback(callback: CallbackQuery):
             patch_response.raise_for_status()
 
             label = "час" if minutes == 60 else f"{minutes} мин"
-            await callback.message.edit_reply_markup(reply_markup=None)
+            await remove_task_buttons(callback.message, task_id)
             await callback.message.reply(f"🔕 Отложено на {label}")
             await callback.answer(f"Отложено на {label}")
 
@@ -376,15 +618,13 @@ async def handle_voice(message: Message, bot: Bot):
     user_id = message.from_user.id
     chat_id = message.chat.id
     
-    # Rate limit check (bypass for admins)
-    rate_limit_key = f"voice_limit:{user_id}"
-    if user_id not in ADMIN_IDS and await redis_client.get(rate_limit_key):
-        await message.answer("⏳ Подождите минуту перед отправкой следующего голосового.")
-        return
-    
+    # Transcription is the expensive part: one voice message per VOICE_RATE_LIMIT_SECONDS (bypass for admins)
     if user_id not in ADMIN_IDS:
-        await redis_client.set(rate_limit_key, "1", ex=VOICE_RATE_LIMIT_SECONDS)
-        
+        allowed, _ = await acquire_tokens(Bucket(f"ratelimit:voice:{user_id}", 1, 1 / VOICE_RATE_LIMIT_SECONDS))
+        if not allowed:
+            await message.answer("⏳ Подождите минуту перед отправкой следующего голосового.")
+            return
+
     await bot.send_chat_action(chat_id, "typing")
 
     user_timezone = await get_user_timezone(user_id)
@@ -428,13 +668,9 @@ async def handle_voice(message: Message, bot: Bot):
             "timezone": user_timezone,
         }
 
-        async with httpx.AsyncClient(timeout=10.0) as http_client:
-            response = await http_client.post(
-                f"{BACKEND_URL}/api/process-async",
-                json=payload,
-                headers=get_backend_headers()
-            )
-            response.raise_for_status()
+        error_text = await submit_llm_request(payload, f"{chat_id}:{processing_msg.message_id}")
+        if error_text:
+            await processing_msg.edit_text(error_text)
 
     except Exception as e:
         logging.exception(f"Error processing voice: {e}")
@@ -454,8 +690,8 @@ async def handle_complete_callback(callback: CallbackQuery):
             )
             response.raise_for_status()
 
-            # Remove inline buttons from notification
-            await callback.message.edit_reply_markup(reply_markup=None)
+            # Remove this task's inline buttons from the notification
+            await remove_task_buttons(callback.message, task_id)
             # Reply to the notification message with status
             await callback.message.reply("✅ Задача завершена")
             await callback.answer("Задача завершена")
@@ -481,11 +717,41 @@ async def setup_menu_button(bot: Bot):
 async def main() -> None:
     bot = Bot(TOKEN)
     await setup_menu_button(bot)
+    # A webhook left over from a webhook deployment would make getUpdates fail
+    await bot.delete_webhook()
     await dp.start_polling(bot)
 
+async def on_webhook_startup(bot: Bot) -> None:
+    await setup_menu_button(bot)
+    # Every replica sets the same webhook, so this is safe to repeat. It is
+    # deliberately not deleted on shutdown: other replicas keep serving it.
+    await bot.set_webhook(
+        WEBHOOK_URL,
+        secret_token=WEBHOOK_SECRET,
+        allowed_updates=dp.resolve_used_update_types(),
+    )
+    logging.info(f"Webhook set to {WEBHOOK_URL}")
+
+async def healthcheck(request: web.Request) -> web.Response:
+    return web.Response(text="ok")
+
+def run_webhook() -> None:
+    bot = Bot(TOKEN)
+    dp.startup.register(on_webhook_startup)
+
+    app = web.Application()
+    app.router.add_get("/healthz", healthcheck)
+    # Rejects requests without Telegram's X-Telegram-Bot-Api-Secret-Token header
+    SimpleRequestHandler(dispatcher=dp, bot=bot, secret_token=WEBHOOK_SECRET).register(app, path=WEBHOOK_PATH)
+    setup_application(app, dp, bot=bot)
+    web.run_app(app, host="0.0.0.0", port=WEBHOOK_PORT)
+
 if __name__ == "__main__":
     logging.basicConfig(level=logging.INFO, stream=sys.stdout)
     if TOKEN is None:
         logging.critical("BOT_TOKEN environment variable is not set")
         sys.exit(1)
-    asyncio.run(main())
\ No newline at end of file
+    if BOT_MODE == "webhook":
+        run_webhook()
+    else:
+        asyncio.run(main())
\ No newline at end of file